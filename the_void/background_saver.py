@@ -0,0 +1,74 @@
+import time
+import threading
+import traceback
+
+# writes session files on a worker thread, so the prompt never waits on disk
+# jobs are functions that only touch copies made when they were submitted
+# (a copy of the graph, a slice of the change list), and run in the order
+# submitted. they are held back until enough changes have piled up, the
+# oldest has waited long enough, or a flush asks for them
+
+
+class BackgroundSaver:
+    def __init__(self, max_changes, max_seconds):
+        self.max_changes = max_changes
+        self.max_seconds = max_seconds
+        # [(time submitted, number of changes, function)]
+        self.jobs = []
+        self.urgent = False
+        self.running = False
+        # tracebacks of failed jobs, for the prompt to show
+        self.errors = []
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def submit(self, function, changes=0, urgent=False):
+        with self.condition:
+            self.jobs.append((time.time(), changes, function))
+            self.urgent = self.urgent or urgent
+            if self.thread is None:
+                # daemon, so a stuck write can't keep the void from quitting
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+
+    # start on everything submitted so far
+    def flush(self):
+        with self.condition:
+            self.urgent = True
+            self.condition.notify_all()
+
+    # flush and block until everything submitted so far is on disk
+    def wait(self):
+        with self.condition:
+            while self.jobs or self.running:
+                self.urgent = True
+                self.condition.notify_all()
+                self.condition.wait()
+
+    # seconds until the jobs are due, 0 if due now, None if no jobs
+    def due_in(self):
+        if not self.jobs:
+            return None
+        if self.urgent or \
+           sum(changes for _, changes, _ in self.jobs) >= self.max_changes:
+            return 0
+        return max(0, self.jobs[0][0] + self.max_seconds - time.time())
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.due_in() != 0:
+                    self.condition.wait(self.due_in())
+                jobs = self.jobs
+                self.jobs = []
+                self.urgent = False
+                self.running = True
+            for _, _, function in jobs:
+                try:
+                    function()
+                except Exception:
+                    self.errors.append(traceback.format_exc())
+            with self.condition:
+                self.running = False
+                self.condition.notify_all()
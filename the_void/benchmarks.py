@@ -0,0 +1,219 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# timing checks for the void, run from this folder:
+#   python benchmarks.py startup
+#   python benchmarks.py sessions
+#   python benchmarks.py ingest
+#   python benchmarks.py traverse
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROMPT = '(? for options)'
+
+
+# STARTUP - cold start of a session, from launch to the first prompt
+def time_import():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'import the_void'],
+                   cwd=HERE, check=True)
+    return time.perf_counter() - start
+
+
+# run in an empty folder of its own, so it never touches the real saved
+# sessions (or their crash marker, which would make it wait on the recover
+# question instead of the prompt)
+def time_first_prompt():
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    with tempfile.TemporaryDirectory() as folder:
+        os.makedirs(os.path.join(folder, 'saved_sessions', 'snapshots'))
+        start = time.perf_counter()
+        session = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, 'the_void.py')], cwd=folder,
+            env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            universal_newlines=True)
+        output = ''
+        while PROMPT not in output:
+            char = session.stdout.read(1)
+            if not char:
+                session.kill()
+                raise RuntimeError('session exited before prompt: ' + output)
+            output += char
+        elapsed = time.perf_counter() - start
+        session.communicate('/q\n')
+    return elapsed
+
+
+def max_child_memory():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # kilobytes on linux, bytes on mac
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return usage * 1024 if sys.platform != 'darwin' else usage
+
+
+def startup(args):
+    imports = [time_import() for _ in range(args.runs)]
+    prompts = [time_first_prompt() for _ in range(args.runs)]
+    print('import the_void:  median {:.3f}s  (min {:.3f}s)'.format(
+        statistics.median(imports), min(imports)))
+    print('first prompt:     median {:.3f}s  (min {:.3f}s)'.format(
+        statistics.median(prompts), min(prompts)))
+    memory = max_child_memory()
+    if memory:
+        print('peak memory:      {:.1f}MB'.format(memory / 2 ** 20))
+
+
+# SESSIONS - load time and file size of each session format
+# made up map: every new node is a child or sibling of a random earlier one
+def generated_graph(size, seed=0):
+    import networkx as nx
+    rng = random.Random(seed)
+    words = ['idea', 'todo', 'plan', 'why', 'maybe', 'later', 'call', 'read',
+             'write', 'fix', 'the', 'a', 'big', 'small', 'next', 'week']
+    graph = nx.DiGraph()
+    nodes = []
+    for i in range(size):
+        node = ' '.join(rng.choice(words) for _ in range(rng.randint(2, 7)))
+        node += ' ' + str(i)
+        graph.add_node(node, timeCreated=1.5e9 + i * 60.0)
+        if nodes:
+            other = rng.choice(nodes)
+            graph.add_edge(other, node)
+            if rng.random() < .5:
+                graph.add_edge(node, other)
+        nodes.append(node)
+    return graph
+
+
+def time_call(function, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def sessions(args):
+    import networkx as nx
+    import session_format
+    formats = [('gml', nx.write_gml, session_format.read_any),
+               ('binary', session_format.write, session_format.read_any)]
+    folder = tempfile.mkdtemp()
+    for size in args.sizes:
+        graph = generated_graph(size)
+        print('{} nodes, {} edges'.format(size, graph.number_of_edges()))
+        for name, write, read in formats:
+            path = os.path.join(folder, name + str(size))
+            saving = time_call(lambda: write(graph, path), args.runs)
+            loading = time_call(lambda: read(path), args.runs)
+            assert set(read(path).edges()) == set(graph.edges())
+            print('  {:<7} load {:7.3f}s  save {:7.3f}s  size {:7.1f}MB'.format(
+                name, loading, saving, os.path.getsize(path) / 2 ** 20))
+            os.remove(path)
+    os.rmdir(folder)
+
+
+# INGEST - building a session from an outline file (outline_import)
+# made up outline: a random tree (each note under one of the 50 before it)
+# written out depth first
+def generated_outline(size, seed=0):
+    rng = random.Random(seed)
+    children = [[] for _ in range(size)]
+    for i in range(1, size):
+        children[rng.randrange(max(0, i - 50), i)].append(i)
+    lines = []
+    stack = [(0, 0)]
+    while stack:
+        i, depth = stack.pop()
+        lines.append('    ' * depth + '- note {}'.format(i))
+        stack.extend((c, depth + 1) for c in reversed(children[i]))
+    return lines
+
+
+def ingest(args):
+    import outline_import
+    from the_void import Void
+    lines = generated_outline(args.lines)
+    void = Void()
+    start = time.perf_counter()
+    added, _ = outline_import.ingest(void, lines)
+    elapsed = time.perf_counter() - start
+    print('{} lines -> {} nodes, {} edges in {:.2f}s ({:.0f} nodes/sec)'.format(
+        len(lines), added, void.export_graph().number_of_edges(), elapsed,
+        added / elapsed))
+
+
+# TRAVERSE - pressing enter over and over (auto_traverse), on a generated
+# map loaded like a saved session, adding a note every so often
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def traverse(args):
+    import session_format
+    from the_void import Void
+    folder = tempfile.mkdtemp()
+    for size in args.sizes:
+        session_format.write(generated_graph(size), os.path.join(folder, 'map'))
+        void = Void()
+        void.load_file(folder + os.sep, 'map')
+        node = void.primary_node()
+        times = []
+        for step in range(args.steps):
+            if args.add_every and step % args.add_every == 0:
+                # what typing >note does, visits reset with it
+                node = void.add_node('note ' + str(step), node, 'child')
+                void.end_command()
+            start = time.perf_counter()
+            void.visit(node)
+            node = void.auto_traverse(node)
+            void.end_command()
+            times.append(time.perf_counter() - start)
+        print('{} nodes, {} enters: median {:.3f}ms  99% {:.3f}ms  '
+              'max {:.3f}ms'.format(
+                  size, args.steps, statistics.median(times) * 1000,
+                  percentile(times, .99) * 1000, max(times) * 1000))
+        os.remove(os.path.join(folder, 'map'))
+    os.rmdir(folder)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='the void benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    command = commands.add_parser(
+        'startup', help='time from launch to first prompt')
+    command.add_argument('--runs', type=int, default=5)
+    command.set_defaults(run=startup)
+    command = commands.add_parser(
+        'sessions', help='load time and file size of gml vs binary saves')
+    command.add_argument('--sizes', type=int, nargs='+',
+                         default=[10000, 100000])
+    command.add_argument('--runs', type=int, default=3)
+    command.set_defaults(run=sessions)
+    command = commands.add_parser(
+        'ingest', help='nodes per second building a session from an outline')
+    command.add_argument('--lines', type=int, default=50000)
+    command.set_defaults(run=ingest)
+    command = commands.add_parser(
+        'traverse', help='time per enter press (auto traverse)')
+    command.add_argument('--sizes', type=int, nargs='+',
+                         default=[10000, 100000])
+    command.add_argument('--steps', type=int, default=20000)
+    command.add_argument('--add-every', type=int, default=100,
+                         help='add a child note every this many enters '
+                              '(0 for never)')
+    command.set_defaults(run=traverse)
+    args = parser.parse_args()
+    if not args.command:
+        parser.print_help()
+    else:
+        args.run(args)
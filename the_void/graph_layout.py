@@ -0,0 +1,191 @@
+import math
+import random
+import networkx as nx
+import numpy as np
+
+# positions for drawing the map, picked by graph size:
+#  - kamada-kawai on path lengths for small maps (nicest, but cubic)
+#  - fruchterman-reingold for medium maps
+#  - rings by bfs depth + sampled force-directed passes for big maps
+# positions live in the 'x'/'y' node attributes, so they are saved with the
+# session and later layouts only have to place what is new
+KAMADA_KAWAI_MAX_NODES = 150
+SPRING_MAX_NODES = 1500
+# redo the whole layout once more than this fraction of nodes is new
+WARM_START_MAX_NEW = .1
+# iterations for the force-directed passes
+SPRING_ITERATIONS = 50
+WARM_START_ITERATIONS = 30
+# nodes each node is pushed away from per pass, when sampling repulsion
+REPULSION_SAMPLE_SIZE = 64
+
+
+def stored_positions(graph):
+    pos = dict()
+    for n, data in graph.nodes(data=True):
+        if 'x' in data and 'y' in data:
+            pos[n] = (data['x'], data['y'])
+    return pos
+
+
+def neighbors(graph, node):
+    if graph.is_directed():
+        return set(graph.succ[node]) | set(graph.pred[node])
+    return set(graph[node])
+
+
+def store_positions(graph, pos):
+    for n, (x, y) in pos.items():
+        graph.nodes[n]['x'] = float(x)
+        graph.nodes[n]['y'] = float(y)
+
+
+# lay out graph, starting from stored positions when few nodes are new
+# path_lengths is only called when a full kamada-kawai layout is needed
+def compute(graph, path_lengths):
+    if not graph:
+        return dict()
+    old = stored_positions(graph)
+    new = [n for n in graph if n not in old]
+    if old and len(new) <= max(1, WARM_START_MAX_NEW * len(graph)):
+        pos = warm_start(graph, old, new)
+    else:
+        pos = from_scratch(graph, path_lengths)
+    store_positions(graph, pos)
+    return pos
+
+
+def from_scratch(graph, path_lengths):
+    undirected = nx.Graph(graph)
+    if len(graph) == 1:
+        return {n: (0.0, 0.0) for n in graph}
+    if len(graph) <= KAMADA_KAWAI_MAX_NODES:
+        distances = dict()
+        for n, lengths in path_lengths().items():
+            distances[n] = {n2: 2 + d for n2, d in lengths.items() if n != n2}
+        return nx.kamada_kawai_layout(undirected, dist=distances)
+    if len(graph) <= SPRING_MAX_NODES:
+        return nx.spring_layout(
+            undirected, iterations=SPRING_ITERATIONS, seed=0)
+    return sampled_spring(undirected, bfs_rings(undirected),
+                          iterations=SPRING_ITERATIONS)
+
+
+# cheap starting point for big graphs: each connected piece as rings around
+# its first node, one ring per hop, pieces side by side
+def bfs_rings(graph):
+    pos = dict()
+    offset = 0.0
+    for start in graph:
+        if start in pos:
+            continue
+        levels = [[start]]
+        seen = {start}
+        while levels[-1]:
+            level = []
+            for n in levels[-1]:
+                for m in graph[n]:
+                    if m not in seen:
+                        seen.add(m)
+                        level.append(m)
+            levels.append(level)
+        radius = len(levels)
+        for depth, level in enumerate(levels):
+            for i, n in enumerate(level):
+                angle = 2 * math.pi * i / len(level)
+                pos[n] = (offset + radius + depth * math.cos(angle),
+                          depth * math.sin(angle))
+        offset += 2 * radius + 1
+    return pos
+
+
+# keep known positions, put new nodes next to their placed neighbors and
+# let only the new nodes settle
+def warm_start(graph, old, new):
+    pos = dict(old)
+    if not new:
+        return pos
+    rng = random.Random(0)
+    xs = [p[0] for p in old.values()]
+    ys = [p[1] for p in old.values()]
+    spread = max(max(xs) - min(xs), max(ys) - min(ys), 1.0)
+    nudge = spread / max(math.sqrt(len(graph)), 1.0)
+    waiting = dict.fromkeys(new)
+    frontier = [n for n in new if any(m in pos for m in neighbors(graph, n))]
+    while waiting:
+        if not frontier:
+            # nothing placed around it (disconnected), anywhere will do
+            n = next(iter(waiting))
+            del waiting[n]
+            pos[n] = (rng.uniform(min(xs), max(xs)),
+                      rng.uniform(min(ys), max(ys)))
+            frontier = [m for m in neighbors(graph, n) if m in waiting]
+            continue
+        next_frontier = []
+        for n in frontier:
+            if n not in waiting:
+                continue
+            del waiting[n]
+            around = neighbors(graph, n)
+            placed = [pos[m] for m in around if m in pos]
+            x = sum(p[0] for p in placed) / len(placed)
+            y = sum(p[1] for p in placed) / len(placed)
+            angle = rng.uniform(0, 2 * math.pi)
+            pos[n] = (x + nudge * math.cos(angle), y + nudge * math.sin(angle))
+            next_frontier.extend(m for m in around if m in waiting)
+        frontier = next_frontier
+    # small steps, new nodes should settle near where they were put
+    return sampled_spring(graph, pos, moving=new,
+                          iterations=WARM_START_ITERATIONS,
+                          temperature=nudge / 5)
+
+
+# fruchterman-reingold where each pass pushes nodes away from a random
+# sample of nodes instead of all of them, and only moving nodes are updated
+# cost per pass ~ (moving nodes * sample size + their edges)
+def sampled_spring(graph, pos, moving=None, iterations=SPRING_ITERATIONS,
+                   temperature=None):
+    nodes = list(graph)
+    if len(nodes) < 2:
+        return dict(pos)
+    index = {n: i for i, n in enumerate(nodes)}
+    xy = np.array([pos[n] for n in nodes], dtype=float)
+    moving = set(nodes if moving is None else moving)
+    rows = np.array(sorted(index[n] for n in moving), dtype=int)
+    if not len(rows):
+        return dict(pos)
+    # each edge touching a moving node once
+    edges = []
+    for n in moving:
+        for m in neighbors(graph, n):
+            if m not in moving or index[m] > index[n]:
+                edges.append((index[n], index[m]))
+    edges = np.array(edges, dtype=int).reshape(-1, 2)
+    spread = max((xy.max(axis=0) - xy.min(axis=0)).max(), 1e-3)
+    k = spread / math.sqrt(len(nodes))
+    if temperature is None:
+        temperature = spread / 10
+    cooling = temperature / (iterations + 1)
+    sample_size = min(REPULSION_SAMPLE_SIZE, len(nodes))
+    scale = len(nodes) / sample_size
+    rng = np.random.RandomState(0)
+    for _ in range(iterations):
+        disp = np.zeros((len(rows), 2))
+        # repulsion, sampled and scaled up to stand in for every node
+        sample = rng.randint(len(nodes), size=sample_size)
+        delta = xy[rows][:, None, :] - xy[sample][None, :, :]
+        dist2 = np.maximum((delta ** 2).sum(axis=2), 1e-9)
+        disp += (delta * (k * k / dist2)[:, :, None]).sum(axis=1) * scale
+        # attraction along edges
+        if len(edges):
+            full = np.zeros_like(xy)
+            delta = xy[edges[:, 0]] - xy[edges[:, 1]]
+            dist = np.sqrt((delta ** 2).sum(axis=1))
+            force = delta * (dist / k)[:, None]
+            np.add.at(full, edges[:, 0], -force)
+            np.add.at(full, edges[:, 1], force)
+            disp += full[rows]
+        length = np.maximum(np.sqrt((disp ** 2).sum(axis=1)), 1e-9)
+        xy[rows] += disp * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= cooling
+    return {n: tuple(xy[index[n]]) for n in nodes}
@@ -0,0 +1,95 @@
+import networkx as nx
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# drawing the map with matplotlib, either in a (tk) window or to a file
+# through the non-interactive agg backend, which works on headless machines
+NODE_COLOR = '#00a400'
+EDGE_COLOR = 'gray'
+LABEL_WIDTH = 22
+# size of a window / file drawing, in pixels
+WIDTH = 1080
+HEIGHT = 640
+DPI = 100
+
+
+def insert_newlines(string, every):
+    lines = []
+    start = 0
+    while start < len(string):
+        end = start + every
+        while end < len(string) and string[end] != ' ':
+            end -= 1
+            if end == start:
+                end = start + every
+                break
+        lines.append(string[start:end])
+        start = end
+    return '\n'.join(lines)
+
+
+def format_node_text(string):
+    return insert_newlines(string, LABEL_WIDTH)
+
+
+# copy prettified version of the map, with positions keyed by the new labels
+# everything returned is plain data, so it can be handed to another process
+def prettify(graph, layout):
+    labels = {n: format_node_text(n) for n in graph}
+    # one pass over nodes and edges, attributes kept
+    pretty_version = nx.relabel_nodes(graph, labels)
+    pos = {labels[n]: p for n, p in layout.items()}
+    # color todo
+    color_map = [NODE_COLOR for n in pretty_version]
+    return pretty_version, pos, color_map
+
+
+# same as nx.draw, but only ever touching the given axes (nx.draw pokes
+# pyplot, which would try to load the window backend)
+def draw_on(ax, pretty_version, pos, color_map):
+    nx.draw_networkx_nodes(pretty_version, pos, ax=ax, node_color=color_map)
+    nx.draw_networkx_edges(pretty_version, pos, ax=ax, edge_color=EDGE_COLOR)
+    nx.draw_networkx_labels(pretty_version, pos, ax=ax, font_weight='bold')
+    ax.get_figure().set_facecolor('w')
+    ax.set_axis_off()
+    ax.margins(x=.12)
+
+
+# draw in new window, blocks until it is closed
+def show(pretty_version, pos, color_map):
+    # hack to make use same backend
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot
+    draw_on(matplotlib.pyplot.gca(), pretty_version, pos, color_map)
+    mng = matplotlib.pyplot.get_current_fig_manager()
+    # mng.window.state('zoomed')
+    # hack to cause window focus, not sure why it works
+    mng.window.state('iconic')
+    mng.window.minsize(width=WIDTH, height=HEIGHT)
+    matplotlib.pyplot.show()
+
+
+# write drawing to path, format from its extension (.svg, .png, .pdf...)
+# never touches pyplot, so it can run in a worker process
+def render_file(pretty_version, pos, color_map, path):
+    figure = Figure(figsize=(WIDTH / DPI, HEIGHT / DPI), dpi=DPI)
+    FigureCanvasAgg(figure)
+    draw_on(figure.add_subplot(1, 1, 1), pretty_version, pos, color_map)
+    figure.savefig(path)
+    return path
+
+
+# lay out graph and draw it to path, for running in another process
+# (layouts get slow on big maps, and the prompt shouldn't wait for them)
+# the layout goes down positions (a connection) first, if given
+def layout_and_render(graph, path, positions=None):
+    import graph_layout
+    undirected = nx.Graph(graph)
+    layout = graph_layout.compute(
+        graph, lambda: dict(nx.all_pairs_shortest_path_length(undirected)))
+    if positions is not None:
+        positions.send({n: (float(x), float(y))
+                        for n, (x, y) in layout.items()})
+        positions.close()
+    return render_file(*prettify(graph, layout), path)
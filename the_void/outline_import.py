@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import argparse
+from the_void import Void
+
+# build a session from an outline file, no prompts:
+#   python outline_import.py brainstorm.txt
+# a line indented under another becomes its child, lines at the same level
+# become siblings - the same as typing >_ and _ at the prompt. a leading
+# '- ', '* ' or '+ ' bullet is dropped, blank lines are skipped
+TAB_WIDTH = 4
+BULLETS = ['- ', '* ', '+ ']
+
+
+# (indentation, text) for each non blank line
+def parse(lines):
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if '\t' in line:
+            line = line.expandtabs(TAB_WIDTH)
+        text = line.strip()
+        if not text:
+            continue
+        for bullet in BULLETS:
+            if text.startswith(bullet):
+                text = text[len(bullet):].strip()
+                break
+        if text:
+            yield len(line) - len(line.lstrip()), text
+
+
+# add outline lines to void, returns (nodes added, lines skipped)
+def ingest(void, lines):
+    added = 0
+    skipped = 0
+    # (indentation, node) of the last line at each open level
+    levels = []
+    for indentation, text in parse(lines):
+        if not void.is_valid_node_name(text):
+            skipped += 1
+            continue
+        while levels and levels[-1][0] > indentation:
+            levels.pop()
+        new = not void.contains(text)
+        if levels and levels[-1][0] == indentation:
+            void.add_sibling(text, levels.pop()[1])
+        else:
+            void.add_child(text, levels[-1][1] if levels else None)
+        levels.append((indentation, text))
+        added += new
+    return added, skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='build a void session from an outline file')
+    parser.add_argument('outline')
+    parser.add_argument('--save', help='session name (default: file name)')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='replace a saved session with the same name')
+    args = parser.parse_args()
+    name = args.save or os.path.splitext(os.path.basename(args.outline))[0]
+    void = Void()
+    if not void.is_valid_file_name(name):
+        sys.exit('invalid session name: ' + name)
+    if name in void.saved_sessions(void.SAVE_DIR) and not args.overwrite:
+        sys.exit('session {} already exists (--overwrite)'.format(name))
+    start = time.perf_counter()
+    with open(args.outline, encoding='utf-8') as f:
+        added, skipped = ingest(void, f)
+    elapsed = time.perf_counter() - start
+    void.name = name
+    void.write_session(void.SAVE_DIR + name)
+    void.saver.wait()
+    void.check_saves()
+    print('{} nodes in {:.2f}s ({:.0f} nodes/sec), saved as {}'.format(
+        added, elapsed, added / max(elapsed, 1e-9), name))
+    if skipped:
+        print('skipped {} lines starting with /'.format(skipped))
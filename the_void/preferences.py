@@ -0,0 +1,95 @@
+import json
+
+# answers given when picking between two nodes (/p, /o and co.), kept with
+# the session so no question is asked twice - or at all, when earlier
+# answers already settle it (a over b and b over c means a over c)
+# saved as json in the graph attribute PREFERENCES: [winner, loser] pairs,
+# oldest answer first (a string, since gml can't hold nested lists)
+PREFERENCES = 'preferences'
+
+
+class PreferenceStore:
+    def __init__(self, pairs=()):
+        # (winner, loser) -> None, in the order they were answered
+        self.pairs = {}
+        # node -> dict used as an ordered set of nodes it won / lost against
+        self.beats = {}
+        self.beaten_by = {}
+        for winner, loser in pairs:
+            self.record(winner, loser)
+
+    # answers stored with graph, leaving out ones about missing nodes
+    @staticmethod
+    def from_graph(graph):
+        pairs = json.loads(graph.graph.get(PREFERENCES, '[]'))
+        return PreferenceStore((winner, loser) for winner, loser in pairs
+                               if winner in graph and loser in graph)
+
+    def to_attribute(self):
+        return json.dumps([list(pair) for pair in self.pairs])
+
+    def __len__(self):
+        return len(self.pairs)
+
+    # winner was picked over loser, replacing any answer the other way
+    def record(self, winner, loser):
+        if winner == loser:
+            return
+        self.forget(loser, winner)
+        self.forget(winner, loser)
+        self.pairs[(winner, loser)] = None
+        self.beats.setdefault(winner, {})[loser] = None
+        self.beaten_by.setdefault(loser, {})[winner] = None
+
+    def forget(self, winner, loser):
+        if (winner, loser) not in self.pairs:
+            return
+        del self.pairs[(winner, loser)]
+        for index, node, other in [(self.beats, winner, loser),
+                                   (self.beaten_by, loser, winner)]:
+            del index[node][other]
+            if not index[node]:
+                del index[node]
+
+    # drop every answer about node
+    def remove(self, node):
+        for loser in list(self.beats.get(node, ())):
+            self.forget(node, loser)
+        for winner in list(self.beaten_by.get(node, ())):
+            self.forget(winner, node)
+
+    # node's answers carry over to new (on top of new's own, if merging)
+    def rename(self, node, new):
+        won = list(self.beats.get(node, ()))
+        lost = list(self.beaten_by.get(node, ()))
+        self.remove(node)
+        for loser in won:
+            self.record(new, loser)
+        for winner in lost:
+            self.record(winner, new)
+
+    # winner over loser follows from the answers (directly or in a chain)
+    def implies(self, winner, loser):
+        found = {winner}
+        frontier = [winner]
+        while frontier:
+            node = frontier.pop()
+            for other in self.beats.get(node, ()):
+                if other == loser:
+                    return True
+                if other not in found:
+                    found.add(other)
+                    frontier.append(other)
+        return False
+
+    # the one of a and b the answers so far prefer, None if they don't
+    # settle it (never compared, or answers contradicting each other)
+    def preferred(self, a, b):
+        if (a, b) in self.pairs:
+            return a
+        if (b, a) in self.pairs:
+            return b
+        a_wins, b_wins = self.implies(a, b), self.implies(b, a)
+        if a_wins != b_wins:
+            return a if a_wins else b
+        return None
@@ -0,0 +1,98 @@
+import os
+import json
+import session_journal
+
+# listing of the session files in one folder without touching each file
+# catalog.json in the folder holds name -> mtime, node count and size, and
+# the folder's own mtime when the catalog was last checked. the void updates
+# it whenever it writes or deletes a session file, and as long as the folder
+# mtime matches nothing else is looked at. otherwise (files added/removed
+# some other way) one scan of the folder names brings it up to date, only
+# new files get stat-ed
+CATALOG_NAME = 'catalog.json'
+
+
+class SessionCatalog:
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = directory + CATALOG_NAME
+        # (folder mtime, entries) from the last check
+        self.cache = None
+
+    def directory_mtime(self):
+        try:
+            return os.stat(self.directory).st_mtime
+        except OSError:
+            return None
+
+    # session name -> {'mtime': float, 'nodes': int or None, 'size': int}
+    def entries(self):
+        mtime = self.directory_mtime()
+        if mtime is None:
+            return dict()
+        if self.cache is not None and self.cache[0] == mtime:
+            return self.cache[1]
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                catalog = json.load(f)
+            entries = catalog['sessions']
+            checked = catalog['directory_mtime']
+        except (OSError, ValueError, KeyError, TypeError):
+            entries, checked = dict(), None
+        if checked != mtime:
+            entries = self.reconcile(entries)
+        self.cache = (mtime, entries)
+        if checked != mtime:
+            self.write(entries)
+        return entries
+
+    # drop entries for files that are gone, add ones for new files
+    def reconcile(self, entries):
+        on_disk = set()
+        for entry in os.scandir(self.directory):
+            if '.' not in entry.name and entry.is_file():
+                on_disk.add(entry.name)
+        entries = {name: e for name, e in entries.items() if name in on_disk}
+        for name in on_disk - set(entries):
+            entries[name] = self.entry(name, None)
+        return entries
+
+    # catalog entry of session file name, counting its journal (saves that
+    # only append to it change the session too)
+    def entry(self, name, nodes):
+        path = self.directory + name
+        size = os.path.getsize(path)
+        try:
+            size += os.path.getsize(session_journal.journal_path(path))
+        except OSError:
+            pass
+        return {'mtime': session_journal.mtime(path), 'nodes': nodes,
+                'size': size}
+
+    def write(self, entries):
+        # written in place rather than swapped in, so the folder mtime stays
+        # the same. a torn catalog is just rebuilt from the folder
+        mtime = self.directory_mtime()
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'directory_mtime': mtime, 'sessions': entries}, f)
+        # creating the catalog changes the folder mtime
+        if self.directory_mtime() != mtime:
+            return self.write(entries)
+        self.cache = (mtime, entries)
+
+    # record session file name in the folder, just written (or appended to)
+    # with nodes
+    def update(self, name, nodes):
+        entries = dict(self.entries())
+        entries[name] = self.entry(name, nodes)
+        self.write(entries)
+
+    def remove(self, name):
+        entries = dict(self.entries())
+        entries.pop(name, None)
+        self.write(entries)
+
+    # names of session files, oldest first
+    def names(self):
+        entries = self.entries()
+        return sorted(entries, key=lambda name: entries[name]['mtime'])
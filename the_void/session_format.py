@@ -0,0 +1,188 @@
+import os
+import sys
+import array
+import json
+import mmap
+import math
+import struct
+import networkx as nx
+import snapshot_store
+
+# compact binary session files, much faster to load than gml
+#
+# layout (little endian, every section starts 8-byte aligned, so the arrays
+# can be used straight out of an mmap):
+#   header   - MAGIC, version, node count, edge count, then (offset, size)
+#              in bytes of each section below
+#   meta     - json: graph attributes and any unusual node attributes
+#   offsets  - uint64[nodes + 1], where each node's text starts in strings
+#   strings  - every node's text, utf-8, back to back (each stored once)
+#   times    - float64[nodes], timeCreated (nan if unset)
+#   xs, ys   - float64[nodes], drawing positions (nan if unset)
+#   edges    - int32[2 * edges], (from, to) node indices
+#   groups   - int32[nodes], siblingGroup (-1 if none), since version 2
+# files not starting with MAGIC are read as gml, so old saves still load
+# (or as snapshots, see snapshot_store)
+MAGIC = b'VOIDMAP\x00'
+VERSION = 2
+SECTIONS = ['meta', 'offsets', 'strings', 'times', 'xs', 'ys', 'edges',
+            'groups']
+# sections in files of each version
+VERSION_SECTIONS = {1: SECTIONS[:7], 2: SECTIONS}
+START = struct.Struct('<8sI')
+
+
+def header(version):
+    return struct.Struct('<8sIQQ' + 'QQ' * len(VERSION_SECTIONS[version]))
+
+
+HEADER = header(VERSION)
+# node attributes with their own array, the rest go in meta
+PACKED_ATTRIBUTES = {'timeCreated': 'times', 'x': 'xs', 'y': 'ys'}
+# node attribute putting a node in a sibling group: every member of a group
+# is a sibling of every other member, without an edge pair for each (the
+# journal and the void's index use this same name)
+SIBLING_GROUP = 'siblingGroup'
+NO_GROUP = -1
+
+
+def is_binary(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def pad(size):
+    return -size % 8
+
+
+def packed(typecode, values):
+    packed_values = array.array(typecode, values)
+    if sys.byteorder != 'little':
+        packed_values.byteswap()
+    return packed_values.tobytes()
+
+
+def write(graph, path):
+    nodes = list(graph)
+    index = {n: i for i, n in enumerate(nodes)}
+    extra = dict()
+    columns = {name: [] for name in PACKED_ATTRIBUTES.values()}
+    groups = []
+    for i, n in enumerate(nodes):
+        data = graph.nodes[n]
+        for attribute, name in PACKED_ATTRIBUTES.items():
+            columns[name].append(float(data.get(attribute, math.nan)))
+        groups.append(data.get(SIBLING_GROUP, NO_GROUP))
+        other = {k: v for k, v in data.items()
+                 if k not in PACKED_ATTRIBUTES and k != SIBLING_GROUP}
+        if other:
+            extra[i] = other
+    encoded = [n.encode('utf-8') for n in nodes]
+    offsets = [0]
+    for text in encoded:
+        offsets.append(offsets[-1] + len(text))
+    edges = []
+    for n1, n2 in graph.edges():
+        edges.append(index[n1])
+        edges.append(index[n2])
+    meta = {'graph': dict(graph.graph), 'nodes': extra}
+    sections = {
+        'meta': json.dumps(meta).encode('utf-8'),
+        'offsets': packed('Q', offsets),
+        'strings': b''.join(encoded),
+        'times': packed('d', columns['times']),
+        'xs': packed('d', columns['xs']),
+        'ys': packed('d', columns['ys']),
+        'edges': packed('i', edges),
+        'groups': packed('i', groups),
+    }
+    positions = []
+    offset = HEADER.size + pad(HEADER.size)
+    for name in SECTIONS:
+        positions += [offset, len(sections[name])]
+        offset += len(sections[name]) + pad(len(sections[name]))
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(nodes), len(edges) // 2,
+                            *positions))
+        f.write(b'\x00' * pad(HEADER.size))
+        for name in SECTIONS:
+            f.write(sections[name])
+            f.write(b'\x00' * pad(len(sections[name])))
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < START.size:
+            raise ValueError('not a session file: ' + path)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return from_buffer(mapped, path)
+
+
+def from_buffer(buffer, path=''):
+    magic, version = START.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError('not a session file: ' + path)
+    if version not in VERSION_SECTIONS:
+        raise ValueError('session file from a newer version: ' + path)
+    if len(buffer) < header(version).size:
+        raise ValueError('not a session file: ' + path)
+    fields = header(version).unpack_from(buffer)
+    num_nodes, num_edges = fields[2:4]
+    # every view into the buffer, released at the end so an mmap can close
+    views = [memoryview(buffer)]
+    sections = dict()
+    for i, name in enumerate(VERSION_SECTIONS[version]):
+        offset, size = fields[4 + 2 * i], fields[5 + 2 * i]
+        views.append(views[0][offset:offset + size])
+        sections[name] = views[-1]
+
+    def array_of(name, typecode):
+        if sys.byteorder == 'little':
+            views.append(sections[name].cast(typecode))
+            return views[-1]
+        values = array.array(typecode, sections[name].tobytes())
+        values.byteswap()
+        return values
+
+    try:
+        meta = json.loads(bytes(sections['meta']).decode('utf-8'))
+        offsets = array_of('offsets', 'Q')
+        strings = bytes(sections['strings'])
+        nodes = [strings[offsets[i]:offsets[i + 1]].decode('utf-8')
+                 for i in range(num_nodes)]
+        columns = {name: array_of(name, 'd')
+                   for name in PACKED_ATTRIBUTES.values()}
+        extra = meta['nodes']
+        graph = nx.DiGraph()
+        graph.graph.update(meta['graph'])
+        data = [dict(extra.get(str(i), ())) for i in range(num_nodes)]
+        for attribute, name in PACKED_ATTRIBUTES.items():
+            for i, value in enumerate(columns[name].tolist()):
+                # nan != nan, marks an unset attribute
+                if value == value:
+                    data[i][attribute] = value
+        if 'groups' in sections:
+            for i, group in enumerate(array_of('groups', 'i').tolist()):
+                if group != NO_GROUP:
+                    data[i][SIBLING_GROUP] = group
+        graph.add_nodes_from(zip(nodes, data))
+        edges = array_of('edges', 'i').tolist()
+        graph.add_edges_from(zip(map(nodes.__getitem__, edges[0::2]),
+                                 map(nodes.__getitem__, edges[1::2])))
+    finally:
+        for view in reversed(views):
+            view.release()
+    return graph
+
+
+# read a session file in any format
+def read_any(path):
+    if is_binary(path):
+        return read(path)
+    if snapshot_store.is_snapshot(path):
+        return snapshot_store.read(path)
+    graph = nx.read_gml(path)
+    # nx.to_directed gives a frozen view, which can't be edited
+    if not graph.is_directed():
+        graph = graph.to_directed()
+    return graph
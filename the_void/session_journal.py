@@ -0,0 +1,111 @@
+import os
+import json
+import uuid
+from session_format import SIBLING_GROUP
+
+# append-only log of changes next to a session file, so saving only costs
+# what changed since the last save. the session file holds the graph as of
+# the last full write (the base), and its journal the changes made since
+#
+# every journal line is one json list:
+#   ['base', id]                 - first line, id of the base it applies to
+#   ['node', node, timeCreated]  - new lone node (timeCreated may be null)
+#   ['edge', n1, n2]             - new edge n1 -> n2
+#   ['unedge', n1, n2]           - edge n1 -> n2 removed
+#   ['delete', node]             - node and its edges removed
+#   ['rename', node, new]        - node renamed
+#   ['group', node, group]       - node moved to sibling group (null: none)
+#   ['prefer', winner, loser]    - winner picked over loser (see preferences)
+# a base gets a fresh id on every full write, so a journal left over from
+# an older base (e.g. crash right after rewriting the base) is ignored
+JOURNAL_SUFFIX = '.journal'
+BASE_ID = 'journalBase'
+
+
+def journal_path(path):
+    return path + JOURNAL_SUFFIX
+
+
+def new_base_id():
+    return uuid.uuid4().hex
+
+
+# mtime of session file path, counting appends to its journal
+def mtime(path):
+    base = os.path.getmtime(path)
+    try:
+        return max(base, os.path.getmtime(journal_path(path)))
+    except OSError:
+        return base
+
+
+def append(path, base_id, ops):
+    journal = journal_path(path)
+    new = not os.path.exists(journal)
+    with open(journal, 'a', encoding='utf-8') as f:
+        if new:
+            f.write(json.dumps(['base', base_id]) + '\n')
+        for op in ops:
+            f.write(json.dumps(list(op)) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def remove(path):
+    try:
+        os.remove(journal_path(path))
+    except FileNotFoundError:
+        pass
+
+
+# ops in the journal of path that apply to the base with base_id
+def read(path, base_id):
+    ops = []
+    try:
+        f = open(journal_path(path), encoding='utf-8')
+    except FileNotFoundError:
+        return ops
+    with f:
+        for i, line in enumerate(f):
+            try:
+                op = json.loads(line)
+            except ValueError:
+                # torn last line from a crash mid-write, rest is unusable
+                break
+            if i == 0:
+                if op != ['base', base_id]:
+                    return []
+                continue
+            ops.append(tuple(op))
+    return ops
+
+
+# apply ops to a networkx digraph, same effect as the void methods had
+# (answers to picks go to preferences, a PreferenceStore, if given)
+def replay(graph, ops, rename, preferences=None):
+    for op in ops:
+        kind = op[0]
+        if kind == 'node':
+            graph.add_node(op[1])
+            if op[2] is not None:
+                graph.nodes[op[1]]['timeCreated'] = op[2]
+        elif kind == 'edge':
+            graph.add_edge(op[1], op[2])
+        elif kind == 'unedge':
+            graph.remove_edge(op[1], op[2])
+        elif kind == 'delete':
+            graph.remove_node(op[1])
+            if preferences is not None:
+                preferences.remove(op[1])
+        elif kind == 'rename':
+            rename(graph, op[1], op[2])
+            if preferences is not None:
+                preferences.rename(op[1], op[2])
+        elif kind == 'group':
+            if op[2] is None:
+                graph.nodes[op[1]].pop(SIBLING_GROUP, None)
+            else:
+                graph.nodes[op[1]][SIBLING_GROUP] = op[2]
+        elif kind == 'prefer':
+            if preferences is not None:
+                preferences.record(op[1], op[2])
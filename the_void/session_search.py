@@ -0,0 +1,229 @@
+import os
+import json
+import hashlib
+import session_journal
+from session_journal import JOURNAL_SUFFIX
+from snapshot_store import cut, write_file
+
+# search across every saved session and snapshot without loading them
+# each session file gets its own small entry in the index folder, updated
+# whenever the void writes, appends to or deletes that file - so a write
+# costs what that file holds, not what every file holds. files written
+# some other way (or before the index existed) are picked up on the next
+# search
+#
+# an entry lists the parts its nodes are cut into, plus nodes added and
+# removed by journal appends since. nodes are sorted and cut into parts
+# the way snapshot_store cuts snapshot chunks, each part stored once under
+# the hash of its contents - so a session and its snapshots share all
+# their unchanged parts
+INDEX_DIR = 'search_index/'
+ENTRY_DIR = 'files/'
+PART_DIR = 'parts/'
+# index file of older versions, one json holding every file's nodes
+OLD_INDEX_NAME = 'search_index.json'
+
+
+def write_json(path, data):
+    write_file(path, json.dumps(data).encode('utf-8'))
+
+
+def parts(nodes):
+    return cut(sorted(nodes), lambda n: n)
+
+
+class SessionSearch:
+    def __init__(self, directories, read_nodes):
+        # folders holding session files, the index lives in the first one
+        self.directories = directories
+        self.path = directories[0] + INDEX_DIR
+        # function session file path -> node text, for indexing stray files
+        self.read_nodes = read_nodes
+        # entry file name -> (its mtime, contents) from the last read
+        self.cache = dict()
+        # part name -> node text (parts never change once written)
+        self.part_cache = dict()
+
+    def entry_path(self, path):
+        name = hashlib.sha1(path.encode('utf-8')).hexdigest() + '.json'
+        return self.path + ENTRY_DIR + name
+
+    # session file path -> {'mtime': float, 'parts': [part name],
+    #                       'added': [str], 'removed': [str]}
+    def entries(self):
+        entries = dict()
+        try:
+            files = list(os.scandir(self.path + ENTRY_DIR))
+        except OSError:
+            return entries
+        cache = dict()
+        for entry in files:
+            if not entry.name.endswith('.json'):
+                continue
+            mtime = entry.stat().st_mtime
+            if self.cache.get(entry.name, (None,))[0] != mtime:
+                try:
+                    with open(entry.path, encoding='utf-8') as f:
+                        contents = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                self.cache[entry.name] = (mtime, contents)
+            cache[entry.name] = self.cache[entry.name]
+            entries[cache[entry.name][1]['path']] = cache[entry.name][1]
+        self.cache = cache
+        return entries
+
+    def entry(self, path):
+        try:
+            with open(self.entry_path(path), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_entry(self, path, entry):
+        os.makedirs(self.path + ENTRY_DIR, exist_ok=True)
+        entry['path'] = path
+        write_json(self.entry_path(path), entry)
+
+    # (node, node in lowercase) pairs of the part with name
+    def part(self, name):
+        if name not in self.part_cache:
+            try:
+                with open(self.path + PART_DIR + name, encoding='utf-8') as f:
+                    nodes = json.load(f)
+            except (OSError, ValueError):
+                nodes = []
+            self.part_cache[name] = [(n, n.lower()) for n in nodes]
+        return self.part_cache[name]
+
+    # record the nodes just written to session file path, storing only
+    # parts not already stored
+    def update(self, path, nodes):
+        os.makedirs(self.path + PART_DIR, exist_ok=True)
+        names = []
+        for part in parts(nodes):
+            data = json.dumps(part).encode('utf-8')
+            name = hashlib.sha256(data).hexdigest()
+            if not os.path.exists(self.path + PART_DIR + name):
+                write_file(self.path + PART_DIR + name, data)
+            names.append(name)
+        self.write_entry(path, {'mtime': session_journal.mtime(path),
+                                'parts': names, 'added': [], 'removed': []})
+
+    # record journal ops just appended to session file path (see
+    # session_journal), files not indexed yet are left for refresh
+    def append(self, path, ops):
+        entry = self.entry(path)
+        if entry is None:
+            return
+        added = dict.fromkeys(entry['added'])
+        removed = dict.fromkeys(entry['removed'])
+
+        def add(node):
+            removed.pop(node, None)
+            added[node] = None
+
+        def remove(node):
+            added.pop(node, None)
+            removed[node] = None
+        for op in ops:
+            if op[0] == 'node':
+                add(op[1])
+            elif op[0] == 'delete':
+                remove(op[1])
+            elif op[0] == 'rename':
+                remove(op[1])
+                add(op[2])
+        entry['added'] = list(added)
+        entry['removed'] = list(removed)
+        entry['mtime'] = session_journal.mtime(path)
+        self.write_entry(path, entry)
+
+    def remove(self, path):
+        try:
+            os.remove(self.entry_path(path))
+        except FileNotFoundError:
+            return
+        self.collect_garbage()
+
+    # delete parts no entry refers to anymore
+    def collect_garbage(self):
+        used = set()
+        for entry in self.entries().values():
+            used.update(entry['parts'])
+        try:
+            stored = list(os.scandir(self.path + PART_DIR))
+        except OSError:
+            return
+        for part in stored:
+            if part.name not in used and '.' not in part.name:
+                os.remove(part.path)
+                self.part_cache.pop(part.name, None)
+
+    # bring the index in line with the folders: drop deleted files and read
+    # the ones that are new or changed since they were indexed
+    def refresh(self):
+        old_index = self.directories[0] + OLD_INDEX_NAME
+        if os.path.exists(old_index):
+            os.remove(old_index)
+        entries = self.entries()
+        on_disk = dict()
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                continue
+            journals = dict()
+            for entry in os.scandir(directory):
+                if not entry.is_file():
+                    continue
+                if '.' not in entry.name:
+                    on_disk[directory + entry.name] = entry.stat().st_mtime
+                elif entry.name.endswith(JOURNAL_SUFFIX):
+                    journals[directory + entry.name[:-len(JOURNAL_SUFFIX)]] = \
+                        entry.stat().st_mtime
+            # saves that only appended to the journal count as changes too
+            for path, mtime in journals.items():
+                if path in on_disk:
+                    on_disk[path] = max(on_disk[path], mtime)
+        removed = False
+        for path in entries:
+            if path not in on_disk:
+                os.remove(self.entry_path(path))
+                removed = True
+        if removed:
+            self.collect_garbage()
+        for path, mtime in on_disk.items():
+            if path not in entries or entries[path]['mtime'] != mtime:
+                try:
+                    nodes = list(self.read_nodes(path))
+                except Exception:
+                    # not a session file we can read, skip it
+                    nodes = []
+                self.update(path, nodes)
+        return self.entries()
+
+    # (session file path, node) pairs whose node contains query (ignoring
+    # case), best matches first and newer files first among equals
+    # each part is looked through once, however many files share it
+    def search(self, query, score):
+        query = query.lower()
+        # part name -> its nodes containing query
+        matches = dict()
+        # node -> its score
+        scores = dict()
+        hits = []
+        for path, entry in self.refresh().items():
+            found = set()
+            for name in entry['parts']:
+                if name not in matches:
+                    matches[name] = [n for n, text in self.part(name)
+                                     if query in text]
+                if matches[name]:
+                    found.update(matches[name])
+            found.difference_update(entry['removed'])
+            found.update(n for n in entry['added'] if query in n.lower())
+            for node in found:
+                if node not in scores:
+                    scores[node] = score(node.lower(), query)
+                hits.append((scores[node], -entry['mtime'], path, node))
+        hits.sort()
+        return [(path, node) for _, _, path, node in hits]
@@ -0,0 +1,122 @@
+import os
+import json
+import zlib
+import hashlib
+import networkx as nx
+
+# snapshots share their unchanged parts instead of each being a full copy
+#
+# nodes are sorted oldest first and cut into chunks, a chunk ending after
+# any node whose text hashes to 0 mod CHUNK_NODES - so cuts depend only on
+# the nodes around them, and adding/removing/editing a node only changes
+# its own chunk. each chunk (its nodes with their attributes and outgoing
+# edges) is stored once, compressed, named by the hash of its contents, in
+# CHUNK_DIR next to the snapshots. a snapshot file is just MAGIC and a json
+# manifest of its graph attributes and chunk names
+MAGIC = b'VOIDSNAP\n'
+CHUNK_DIR = 'chunks/'
+# average nodes per chunk, and most allowed in one
+CHUNK_NODES = 64
+MAX_CHUNK_NODES = 4 * CHUNK_NODES
+COMPRESSION_LEVEL = 6
+
+
+def is_snapshot(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def chunk_dir(path):
+    return os.path.join(os.path.dirname(path), CHUNK_DIR)
+
+
+# write then swap in, so a crash never leaves half a file
+def write_file(path, data):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+# cut items into chunks, one ending after any item whose text hashes to 0
+# mod CHUNK_NODES (the search index cuts its node lists the same way)
+def cut(items, text):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        end = zlib.crc32(text(item).encode('utf-8')) % CHUNK_NODES == 0
+        if end or len(chunk) >= MAX_CHUNK_NODES:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def chunks(graph):
+    def age(n):
+        return (graph.nodes[n].get('timeCreated', 0.0), n)
+    return cut(([n, graph.nodes[n], list(graph.succ[n])]
+                for n in sorted(graph, key=age)), lambda entry: entry[0])
+
+
+# write graph as snapshot at path, storing only chunks not already stored
+# returns number of new chunks written
+def write(graph, path, attributes=None):
+    directory = chunk_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    names = []
+    written = 0
+    for chunk in chunks(graph):
+        data = json.dumps(chunk, sort_keys=True).encode('utf-8')
+        name = hashlib.sha256(data).hexdigest()
+        if not os.path.exists(directory + name):
+            write_file(directory + name,
+                       zlib.compress(data, COMPRESSION_LEVEL))
+            written += 1
+        names.append(name)
+    graph_attributes = dict(graph.graph if attributes is None else attributes)
+    manifest = {'graph': graph_attributes, 'chunks': names}
+    write_file(path, MAGIC + json.dumps(manifest).encode('utf-8'))
+    return written
+
+
+def manifest(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError('not a snapshot: ' + path)
+    return json.loads(data[len(MAGIC):].decode('utf-8'))
+
+
+def read(path):
+    contents = manifest(path)
+    directory = chunk_dir(path)
+    graph = nx.DiGraph()
+    graph.graph.update(contents['graph'])
+    edges = []
+    for name in contents['chunks']:
+        with open(directory + name, 'rb') as f:
+            chunk = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        for n, data, successors in chunk:
+            graph.add_node(n, **data)
+            edges.extend((n, m) for m in successors)
+    graph.add_edges_from(edges)
+    return graph
+
+
+# delete chunks no snapshot in directory refers to anymore
+# returns number deleted
+def collect_garbage(directory):
+    chunks_directory = directory + CHUNK_DIR
+    if not os.path.isdir(chunks_directory):
+        return 0
+    used = set()
+    for entry in os.scandir(directory):
+        if entry.is_file() and '.' not in entry.name and \
+           is_snapshot(entry.path):
+            used.update(manifest(entry.path)['chunks'])
+    deleted = 0
+    for entry in os.scandir(chunks_directory):
+        if entry.is_file() and entry.name not in used:
+            os.remove(entry.path)
+            deleted += 1
+    return deleted
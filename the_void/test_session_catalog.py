@@ -0,0 +1,68 @@
+import os
+import time
+import pytest
+import session_journal
+from session_catalog import SessionCatalog, CATALOG_NAME
+
+
+@pytest.fixture
+def folder(tmp_path):
+    return str(tmp_path) + '/'
+
+
+def write(folder, name, data=b'x'):
+    with open(folder + name, 'wb') as f:
+        f.write(data)
+
+
+# mtimes far enough apart to order files by, whatever the filesystem
+def age(folder, name, seconds):
+    path = folder + name
+    os.utime(path, (time.time() - seconds, time.time() - seconds))
+
+
+def test_update_and_remove(folder):
+    catalog = SessionCatalog(folder)
+    write(folder, 'a')
+    age(folder, 'a', 20)
+    catalog.update('a', 3)
+    write(folder, 'b', b'xyz')
+    age(folder, 'b', 10)
+    catalog.update('b', 5)
+    assert catalog.names() == ['a', 'b']
+    assert catalog.entries()['b'] == {
+        'mtime': os.path.getmtime(folder + 'b'), 'nodes': 5, 'size': 3}
+    catalog.remove('a')
+    os.remove(folder + 'a')
+    assert SessionCatalog(folder).names() == ['b']
+
+
+# files added or removed behind the void's back are picked up
+def test_reconcile(folder):
+    write(folder, 'a')
+    catalog = SessionCatalog(folder)
+    assert catalog.names() == ['a']
+    assert os.path.exists(folder + CATALOG_NAME)
+    write(folder, 'b')
+    os.remove(folder + 'a')
+    # ignores files with extensions (journals, temporary files)
+    write(folder, 'c.tmp')
+    assert catalog.names() == ['b']
+    assert catalog.entries()['b']['nodes'] is None
+
+
+# a journal append counts as a change of the session
+def test_journal_counts(folder):
+    write(folder, 'a', b'xy')
+    age(folder, 'a', 20)
+    write(folder, 'b')
+    age(folder, 'b', 10)
+    catalog = SessionCatalog(folder)
+    assert catalog.names() == ['a', 'b']
+    session_journal.append(folder + 'a', 'base', [('node', 'n', None)])
+    catalog.update('a', 2)
+    assert catalog.names() == ['b', 'a']
+    entry = catalog.entries()['a']
+    assert entry['mtime'] == session_journal.mtime(folder + 'a')
+    assert entry['size'] == 2 + os.path.getsize(
+        session_journal.journal_path(folder + 'a'))
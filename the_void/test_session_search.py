@@ -0,0 +1,52 @@
+import os
+import pytest
+from session_search import SessionSearch
+
+
+@pytest.fixture
+def search(tmp_path):
+    directories = [str(tmp_path) + '/', str(tmp_path) + '/snapshots/']
+    os.makedirs(directories[1])
+    return SessionSearch(directories, lambda path: [])
+
+
+def save(search, path, nodes):
+    open(path, 'w').close()
+    search.update(path, nodes)
+
+
+def score(text, query):
+    return len(text)
+
+
+def test_search_shared_parts(search):
+    session = search.directories[0] + 'map'
+    snapshot = search.directories[1] + 'map_1'
+    nodes = ['node %04d' % i for i in range(1000)]
+    save(search, snapshot, nodes)
+    save(search, session, nodes)
+    # both files' parts are the same ones
+    assert len(os.listdir(search.path + 'parts')) == \
+        len(search.entries()[session]['parts'])
+    # changes appended to the session's journal leave the snapshot alone
+    with open(session + '.journal', 'w'):
+        pass
+    search.append(session, [('node', 'node new', None),
+                            ('delete', 'node 0007'),
+                            ('rename', 'node 0008', 'renamed 0008')])
+    assert search.search('node 0007', score) == [(snapshot, 'node 0007')]
+    assert search.search('node new', score) == [(session, 'node new')]
+    assert search.search('RENAMED', score) == [(session, 'renamed 0008')]
+    assert sorted(search.search('node 000', score)) == sorted(
+        [(snapshot, 'node %04d' % i) for i in range(10)] +
+        [(session, 'node %04d' % i) for i in range(10) if i not in (7, 8)])
+
+
+def test_remove_collects_parts(search):
+    session = search.directories[0] + 'map'
+    save(search, session, ['a', 'b', 'c'])
+    assert search.search('b', score) == [(session, 'b')]
+    os.remove(session)
+    search.remove(session)
+    assert search.search('b', score) == []
+    assert os.listdir(search.path + 'parts') == []
@@ -0,0 +1,245 @@
+import os
+import time
+import random
+import multiprocessing
+import pytest
+from the_void import Void
+from session_catalog import SessionCatalog
+from session_format import SIBLING_GROUP
+
+# randomized checks of the indexes against the REFERENCE_SCANS versions,
+# of undo/redo, and of saving/loading (full writes and journal appends)
+# run from this folder: python -m pytest -q
+SEEDS = range(10)
+NAMES = ['n%d' % i for i in range(30)]
+
+
+# one random command, applied the way the prompt does it
+def random_command(void, rng):
+    nodes = list(void.relations.ids)
+    node = rng.choice(nodes)
+    other = rng.choice(nodes)
+    name = rng.choice(NAMES)
+    op = rng.random()
+    if op < .25:
+        void.add_sibling(name, node)
+    elif op < .45:
+        void.add_child(name, node)
+    elif op < .55:
+        void.add_parent(name, node)
+    elif op < .65:
+        if other != node and void.has_edge(other, node):
+            void.remove_edge(other, node)
+    elif op < .75:
+        if len(nodes) > 1:
+            void.delete_node(node)
+    elif op < .85:
+        void.edit_node(node, name)
+    else:
+        void.visit(node)
+        void.auto_traverse(node)
+    void.end_command()
+
+
+def new_void():
+    void = Void()
+    void.add_sibling('root')
+    void.end_command()
+    return void
+
+
+# nodes with what the save formats keep of them, and the edges
+def state(void):
+    graph = void.relations.to_graph()
+    return (frozenset(graph.nodes(data='timeCreated')),
+            frozenset(graph.nodes(data=SIBLING_GROUP)),
+            frozenset(graph.edges()))
+
+
+# same, with sibling groups as edge pairs (loading turns edge pairs that
+# form a group into one, which changes nothing about the map)
+def exported_state(void):
+    graph = void.export_graph()
+    return (frozenset(graph.nodes(data='timeCreated')),
+            frozenset(graph.edges()))
+
+
+def check_index(void, rng):
+    graph = void.export_graph()
+    assert set(void.relations.ids) == set(graph)
+    for n in graph:
+        assert set(void.children(n)) == set(void.scan_children(n, graph))
+        assert set(void.siblings(n)) == set(void.scan_siblings(n, graph))
+        assert set(void.parents(n)) == set(void.scan_parents(n, graph))
+    counts = [len(void.scan_parents(n, graph)) for n in void.nodes()]
+    assert counts == sorted(counts)
+    for n in rng.sample(list(graph), min(5, len(graph))):
+        assert void.can_delete(n) == void.scan_can_delete(n)
+    edges = list(graph.edges())
+    for n1, n2 in rng.sample(edges, min(5, len(edges))):
+        assert void.can_remove_edge(n1, n2) == \
+            void.scan_can_remove_edge(n1, n2)
+    assert set(void.search_index.text) == set(graph)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_index_matches_scans(seed):
+    rng = random.Random(seed)
+    void = new_void()
+    for _ in range(150):
+        random_command(void, rng)
+        check_index(void, rng)
+    # auto traverse picks the same next node (and indentation) as the scan
+    node = void.primary_node()
+    for _ in range(100):
+        if rng.random() < .1:
+            node = rng.choice(list(void.relations.ids))
+        void.visit(node)
+        indentation = void.indentation
+        expected = void.scan_auto_traverse(node)
+        expected_indentation = void.indentation
+        void.indentation = indentation
+        node = void.auto_traverse(node)
+        assert (node, void.indentation) == (expected, expected_indentation)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_undo_redo(seed):
+    rng = random.Random(seed)
+    void = new_void()
+    void.undo_stack.clear()
+    # state after each command, and where undo/redo has got to
+    states = [state(void)]
+    position = 0
+    for _ in range(100):
+        op = rng.random()
+        if op < .2 and void.undo_stack:
+            void.undo()
+            position -= 1
+        elif op < .3 and void.redo_stack:
+            void.redo()
+            position += 1
+        else:
+            before = len(void.undo_stack)
+            random_command(void, rng)
+            if len(void.undo_stack) != before:
+                del states[position + 1:]
+                states.append(state(void))
+                position += 1
+        assert state(void) == states[position]
+        check_index(void, rng)
+
+
+@pytest.fixture
+def session_folder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(Void.SNAPSHOT_DIR)
+    return tmp_path
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('session_format', ['binary', 'gml'])
+def test_save_load(seed, session_format, session_folder, monkeypatch):
+    monkeypatch.setattr(Void, 'SESSION_FORMAT', session_format)
+    rng = random.Random(seed)
+    void = new_void()
+    path = Void.SAVE_DIR + 'saved'
+    for turn in range(6):
+        for _ in range(rng.randrange(1, 20)):
+            random_command(void, rng)
+        void.modified = True
+        # the auto save and the save are written (or appended to) in
+        # either order, each must read back as the graph at that point
+        auto_saved = rng.random() < .5
+        if auto_saved:
+            void.auto_save(quiet=True)
+        void.write_session(path)
+        if not auto_saved and rng.random() < .5:
+            void.auto_save(quiet=True)
+            auto_saved = True
+        void.saver.wait()
+        assert not void.saver.errors
+        expected = exported_state(void)
+        for name in ['saved', '_auto_save'] if auto_saved else ['saved']:
+            loaded = Void()
+            loaded.load_file(Void.SAVE_DIR, name)
+            assert exported_state(loaded) == expected
+            check_index(loaded, rng)
+        # carry on from what was loaded, so later saves append to its
+        # journal
+        if turn % 2:
+            void.load_file(Void.SAVE_DIR, 'saved')
+            assert exported_state(void) == expected
+
+
+# a save that only appends to the journal still moves the session to the
+# end of the listing, with its new node count
+def test_journal_save_updates_catalog(session_folder):
+    void = new_void()
+    void.write_session(Void.SAVE_DIR + 'A')
+    void.write_session(Void.SAVE_DIR + 'B')
+    void.saver.wait()
+    for i in range(5):
+        void.add_child('child%d' % i, 'root')
+        void.end_command()
+    void.write_session(Void.SAVE_DIR + 'A')
+    void.saver.wait()
+    assert not void.saver.errors
+    assert os.path.exists(Void.SAVE_DIR + 'A.journal')
+    for catalog in [void.catalogs[Void.SAVE_DIR],
+                    SessionCatalog(Void.SAVE_DIR)]:
+        assert catalog.names() == ['B', 'A']
+        assert catalog.entries()['A']['nodes'] == 6
+
+
+# after a crash the auto save comes back unnamed, and stays that way until
+# saved under a name the user picks
+def test_recover(session_folder, monkeypatch):
+    void = new_void()
+    void.recover()
+    void.write_session(Void.SAVE_DIR + '_auto_save')
+    void.saver.wait()
+    monkeypatch.setattr(Void, 'offer_choice', lambda *args, **kwargs: True)
+    recovered = Void()
+    assert recovered.recover()
+    assert recovered.name == '' and recovered.contains('root')
+    recovered.add_child('first typed', 'root')
+    assert recovered.name == ''
+    recovered.shut_down()
+    assert not os.path.exists(Void.RUNNING_MARKER)
+    assert not Void().recover()
+
+
+# starting somewhere without a saved_sessions folder
+def test_recover_without_folder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert not Void().recover()
+    assert os.path.exists(Void.RUNNING_MARKER)
+
+
+# /gf lays out in the worker, the positions come back to be stored and
+# saved with the session
+def test_background_render_stores_layout(session_folder):
+    void = new_void()
+    for i in range(5):
+        void.add_child('child%d' % i, 'root')
+        void.end_command()
+    path = Void.SAVE_DIR + 'saved'
+    void.write_session(path)
+    void.saver.wait()
+    drawing = void.render(background=True)
+    for process in multiprocessing.active_children():
+        process.join()
+    deadline = time.time() + 10
+    while not void.received_layouts and time.time() < deadline:
+        time.sleep(.01)
+    void.collect_layouts()
+    assert os.path.exists(drawing)
+    graph = void.relations.to_graph()
+    assert all('x' in data for _, data in graph.nodes(data=True))
+    void.write_session(path)
+    void.saver.wait()
+    loaded = Void()
+    loaded.load_file(Void.SAVE_DIR, 'saved')
+    graph = loaded.relations.to_graph()
+    assert all('x' in data for _, data in graph.nodes(data=True))
@@ -1,118 +1,994 @@
 import os
+import copy
 import traceback
+import threading
+import multiprocessing
 import random
 import datetime
+import heapq
 import networkx as nx
-from collections import Counter
+from math import isnan, nan
+from array import array
+from collections import deque
+from itertools import islice
 from colorama import init, Fore, Style
-# hack to make use same backend
-import matplotlib
-matplotlib.use('TkAgg')
+from session_search import SessionSearch
+from session_catalog import SessionCatalog
+from background_saver import BackgroundSaver
+from preferences import PreferenceStore, PREFERENCES
+import session_journal
+import session_format
+from session_format import SIBLING_GROUP, NO_GROUP
+import snapshot_store
+# graph_layout and graph_render (numpy, matplotlib) are only imported on the
+# first drawing, they take most of the startup time otherwise
+
+
+# the map itself: nodes, their attributes and the relationships between them
+# (an edge both ways => siblings, one way => parent to child, same sibling
+# group => siblings)
+# nodes are ids numbered in the order they were added (not reused after a
+# removal), the text of each is held once, connections are arrays of ids
+# and creation times / positions are arrays indexed by id - so renaming a
+# node only changes its text, each connection takes 4 bytes and a node's
+# numbers take 8 bytes each, instead of dicts keyed by node text
+# (the methods still take and give back node text)
+# networkx graphs are built from it only to write files, export, draw and
+# for the reference scans (see to_graph), and read into it on load
+class Relations:
+    # sections of a node's array, in order
+    CHILDREN, SIBLINGS, PARENTS = range(3)
+
+    def __init__(self):
+        # node text -> id
+        self.ids = {}
+        # id -> node text (None once removed)
+        self.text = []
+        # id -> array of ids of related nodes: children, then siblings
+        # (only the ones connected by edges, see siblings_of), then parents
+        # None once removed
+        self.connections = []
+        # id -> length of the children / siblings sections of its array
+        self.num_children = array('i')
+        self.num_siblings = array('i')
+        # id -> sibling group (NO_GROUP if none)
+        self.group_of = array('i')
+        # sibling group -> dict used as an ordered set of its member ids
+        self.groups = {}
+        self.next_group = 0
+        # ids bucketed by number of parents, for ordering the whole graph
+        # (number of parents -> dict used as an ordered set of ids)
+        self.by_num_parents = {}
+        self.num_parents = array('i')
+        self.min_num_parents = 0
+        # id -> creation time and position (NaN where a node has none)
+        self.times = array('d')
+        self.xs = array('d')
+        self.ys = array('d')
+        # id -> any other attributes a loaded file gave the node
+        self.extra = {}
+        # attributes of the map as a whole (networkx's graph.graph)
+        self.attributes = {}
+        # bumped whenever nodes or connections (ignoring direction) change
+        self.version = 0
+
+    @staticmethod
+    def from_graph(graph):
+        relations = Relations()
+        relations.attributes.update(graph.graph)
+        for n, data in graph.nodes(data=True):
+            relations.add_node(n, data)
+            if data.get(SIBLING_GROUP) is not None:
+                relations.join(n, data[SIBLING_GROUP])
+        # filled in directly, none of the pairs are linked yet
+        ids = relations.ids
+        for n1, n2 in graph.edges():
+            i, j = ids[n1], ids[n2]
+            if i == j or relations.same_group_ids(i, j):
+                continue
+            if graph.has_edge(n2, n1):
+                # the pair comes up once from each end
+                if i < j:
+                    relations.link(i, j, Relations.SIBLINGS)
+                    relations.link(j, i, Relations.SIBLINGS)
+            else:
+                relations.link(i, j, Relations.CHILDREN)
+                relations.link(j, i, Relations.PARENTS)
+        for i in ids.values():
+            relations.reorder(i)
+        return relations
+
+    # copy that stays as it is while this one changes (for writing files
+    # from another thread)
+    def copy(self):
+        relations = copy.copy(self)
+        relations.ids = dict(self.ids)
+        relations.text = list(self.text)
+        relations.connections = [None if c is None else c[:]
+                                 for c in self.connections]
+        relations.num_children = self.num_children[:]
+        relations.num_siblings = self.num_siblings[:]
+        relations.group_of = self.group_of[:]
+        relations.groups = {g: dict(m) for g, m in self.groups.items()}
+        relations.by_num_parents = {count: dict(bucket) for count, bucket
+                                    in self.by_num_parents.items()}
+        relations.num_parents = self.num_parents[:]
+        relations.times = self.times[:]
+        relations.xs = self.xs[:]
+        relations.ys = self.ys[:]
+        relations.extra = dict(self.extra)
+        relations.attributes = dict(self.attributes)
+        return relations
+
+    def __contains__(self, node):
+        return node in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    # node's group isn't taken from data, see join
+    def add_node(self, node, data=None):
+        if node in self.ids:
+            return self.ids[node]
+        i = len(self.text)
+        self.ids[node] = i
+        self.text.append(node)
+        self.connections.append(array('i'))
+        self.num_children.append(0)
+        self.num_siblings.append(0)
+        self.group_of.append(NO_GROUP)
+        self.num_parents.append(0)
+        self.times.append(nan)
+        self.xs.append(nan)
+        self.ys.append(nan)
+        if data:
+            self.set_data(node, data)
+        self.add_to_bucket(i, 0)
+        self.version += 1
+        return i
+
+    def remove_node(self, node):
+        i = self.ids[node]
+        if self.group_of[i] != NO_GROUP:
+            self.leave(node)
+        for j in self.linked_ids(i):
+            self.unlink(i, j)
+        self.remove_from_bucket(i, self.num_parents[i])
+        del self.ids[node]
+        self.text[i] = None
+        self.connections[i] = None
+        self.extra.pop(i, None)
+        self.version += 1
+
+    # node keeps its id, connections, group and attributes under the new
+    # text
+    def rename(self, node, new):
+        i = self.ids.pop(node)
+        self.ids[new] = i
+        self.text[i] = new
+
+    # node's edges move to new (which keeps its own attributes), leaving out
+    # ones that would link new to itself or to its own group
+    def merge(self, node, new):
+        successors = self.successors(node)
+        predecessors = self.predecessors(node)
+        self.remove_node(node)
+        for n in successors:
+            self.add_edge(new, n)
+        for n in predecessors:
+            self.add_edge(n, new)
+
+    # ATTRIBUTES
+    # creation time of node, None if it has none
+    def time_created(self, node):
+        time = self.times[self.ids[node]]
+        return None if isnan(time) else time
+
+    def set_time_created(self, node, time):
+        self.times[self.ids[node]] = time
+
+    def set_position(self, node, x, y):
+        i = self.ids[node]
+        self.xs[i] = x
+        self.ys[i] = y
+
+    # set node's attributes (all but its group) from a networkx style dict
+    def set_data(self, node, data):
+        i = self.ids[node]
+        extra = {}
+        for key, value in data.items():
+            number = type(value) in (int, float)
+            if key == 'timeCreated' and number:
+                self.times[i] = value
+            elif key == 'x' and number:
+                self.xs[i] = value
+            elif key == 'y' and number:
+                self.ys[i] = value
+            elif key != SIBLING_GROUP:
+                extra[key] = value
+        if extra:
+            self.extra[i] = extra
+
+    # attributes of id i as networkx would hold them
+    def data(self, i):
+        data = dict(self.extra.get(i, ()))
+        if not isnan(self.times[i]):
+            data['timeCreated'] = self.times[i]
+        if not isnan(self.xs[i]):
+            data['x'] = self.xs[i]
+        if not isnan(self.ys[i]):
+            data['y'] = self.ys[i]
+        if self.group_of[i] != NO_GROUP:
+            data[SIBLING_GROUP] = self.group_of[i]
+        return data
+
+    def data_of(self, node):
+        return self.data(self.ids[node])
+
+    # networkx graph of nodes (all if None) with their attributes and the
+    # edges between them - members of a sibling group get no edges between
+    # them, just the group attribute (see Void.export_graph)
+    def to_graph(self, nodes=None):
+        graph = nx.DiGraph()
+        graph.graph.update(self.attributes)
+        if nodes is None:
+            ids = list(self.ids.values())
+        else:
+            ids = [self.ids[n] for n in nodes]
+        text = self.text
+        graph.add_nodes_from((text[i], self.data(i)) for i in ids)
+        for i in ids:
+            end = self.bounds(i, Relations.SIBLINGS)[1]
+            graph.add_edges_from((text[i], text[j])
+                                 for j in self.connections[i][:end]
+                                 if nodes is None or text[j] in graph)
+        return graph
+
+    # LOOKUPS BY TEXT
+    def names(self, ids):
+        text = self.text
+        return [text[i] for i in ids]
+
+    def children_of(self, node):
+        return self.names(self.child_ids(self.ids[node]))
+
+    def parents_of(self, node):
+        return self.names(self.parent_ids(self.ids[node]))
+
+    def siblings_of(self, node):
+        return self.names(self.sibling_ids(self.ids[node]))
+
+    # siblings connected by edges, leaving out the rest of its group
+    def linked_siblings_of(self, node):
+        return self.names(self.section(self.ids[node], Relations.SIBLINGS))
+
+    def neighbors(self, node):
+        i = self.ids[node]
+        return self.names(self.child_ids(i) + self.sibling_ids(i) +
+                          self.parent_ids(i))
+
+    # neighbors connected by edges, leaving out the rest of its group
+    def linked(self, node):
+        return self.names(self.linked_ids(self.ids[node]))
+
+    # ends of node's edges out / in (siblings connected by edges both ways)
+    def successors(self, node):
+        i = self.ids[node]
+        end = self.bounds(i, Relations.SIBLINGS)[1]
+        return self.names(self.connections[i][:end])
+
+    def predecessors(self, node):
+        i = self.ids[node]
+        start = self.bounds(i, Relations.SIBLINGS)[0]
+        return self.names(self.connections[i][start:])
+
+    # edge n1 -> n2 (members of the same group have none between them)
+    def has_edge(self, n1, n2):
+        i, j = self.ids[n1], self.ids[n2]
+        return self.has(i, j, Relations.CHILDREN, Relations.PARENTS) or \
+            self.has(i, j, Relations.SIBLINGS, Relations.SIBLINGS)
+
+    def are_connected(self, n1, n2):
+        i, j = self.ids[n1], self.ids[n2]
+        return self.connected_ids(i, j) or self.same_group_ids(i, j)
+
+    def are_siblings(self, n1, n2):
+        i, j = self.ids[n1], self.ids[n2]
+        return self.has(i, j, Relations.SIBLINGS, Relations.SIBLINGS) or \
+            self.same_group_ids(i, j)
+
+    def same_group(self, n1, n2):
+        return self.same_group_ids(self.ids[n1], self.ids[n2])
+
+    # n2 is a child of n1
+    def is_parent(self, n1, n2):
+        return self.has(self.ids[n1], self.ids[n2],
+                        Relations.CHILDREN, Relations.PARENTS)
+
+    # sibling group of node, None if none
+    def group(self, node):
+        group = self.group_of[self.ids[node]]
+        return None if group == NO_GROUP else group
+
+    def members(self, group):
+        return self.names(self.groups[group])
+
+    # LOOKUPS BY ID
+    # (start, end) of a section of id i's array
+    def bounds(self, i, kind):
+        children = self.num_children[i]
+        if kind == Relations.CHILDREN:
+            return 0, children
+        if kind == Relations.SIBLINGS:
+            return children, children + self.num_siblings[i]
+        return children + self.num_siblings[i], len(self.connections[i])
+
+    def section(self, i, kind):
+        start, end = self.bounds(i, kind)
+        return self.connections[i][start:end].tolist()
+
+    def child_ids(self, i):
+        return self.section(i, Relations.CHILDREN)
+
+    def parent_ids(self, i):
+        return self.section(i, Relations.PARENTS)
+
+    def sibling_ids(self, i):
+        siblings = self.section(i, Relations.SIBLINGS)
+        group = self.group_of[i]
+        if group != NO_GROUP:
+            siblings += [j for j in self.groups[group] if j != i]
+        return siblings
+
+    def linked_ids(self, i):
+        return self.connections[i].tolist()
+
+    # connected by edges
+    def connected_ids(self, i, j):
+        return j in self.connections[i]
+
+    def same_group_ids(self, i, j):
+        group = self.group_of[i]
+        return group != NO_GROUP and group == self.group_of[j]
+
+    # j in section kind of i, looking through whichever is shorter of that
+    # and section reverse (the opposite relationship) of j
+    def has(self, i, j, kind, reverse):
+        start, end = self.bounds(i, kind)
+        reverse_start, reverse_end = self.bounds(j, reverse)
+        if end - start <= reverse_end - reverse_start:
+            return j in self.connections[i][start:end]
+        return i in self.connections[j][reverse_start:reverse_end]
+
+    # add j to the end of section kind of i
+    def link(self, i, j, kind):
+        self.connections[i].insert(self.bounds(i, kind)[1], j)
+        if kind == Relations.CHILDREN:
+            self.num_children[i] += 1
+        elif kind == Relations.SIBLINGS:
+            self.num_siblings[i] += 1
+
+    # SIBLING GROUPS
+    def new_group(self):
+        self.next_group += 1
+        return self.next_group - 1
+
+    def join(self, node, group):
+        if group not in self.groups:
+            self.groups[group] = {}
+            self.next_group = max(self.next_group, group + 1)
+        i = self.ids[node]
+        self.groups[group][i] = None
+        self.group_of[i] = group
+        self.version += 1
+
+    def leave(self, node):
+        i = self.ids[node]
+        group = self.group_of[i]
+        self.group_of[i] = NO_GROUP
+        del self.groups[group][i]
+        if not self.groups[group]:
+            del self.groups[group]
+        self.version += 1
+
+    # forget whatever relationship ids i and j had through edges
+    def unlink(self, i, j):
+        if self.connected_ids(i, j):
+            self.version += 1
+        for a, b in [(i, j), (j, i)]:
+            connections = self.connections[a]
+            if b in connections:
+                position = connections.index(b)
+                if position < self.num_children[a]:
+                    self.num_children[a] -= 1
+                elif position < self.num_children[a] + self.num_siblings[a]:
+                    self.num_siblings[a] -= 1
+                del connections[position]
+        self.reorder(i)
+        self.reorder(j)
+
+    # edges between members of the same group are left out
+    def add_edge(self, n1, n2):
+        if n1 != n2 and not self.same_group(n1, n2):
+            self.set_pair(n1, n2, True, self.has_edge(n2, n1))
+
+    def remove_edge(self, n1, n2):
+        if n1 != n2 and not self.same_group(n1, n2):
+            self.set_pair(n1, n2, False, self.has_edge(n2, n1))
+
+    # relationship of n1 and n2 from whether there are edges n1 -> n2
+    # (forward) and n2 -> n1 (backward)
+    def set_pair(self, n1, n2, forward, backward):
+        i, j = self.ids[n1], self.ids[n2]
+        version = self.version
+        was_connected = self.connected_ids(i, j)
+        self.unlink(i, j)
+        # only a change of direction, the undirected shape is the same
+        if was_connected == (forward or backward):
+            self.version = version
+        elif forward or backward:
+            self.version += 1
+        if forward and backward:
+            self.link(i, j, Relations.SIBLINGS)
+            self.link(j, i, Relations.SIBLINGS)
+        elif forward:
+            self.link(i, j, Relations.CHILDREN)
+            self.link(j, i, Relations.PARENTS)
+            self.reorder(j)
+        elif backward:
+            self.link(j, i, Relations.CHILDREN)
+            self.link(i, j, Relations.PARENTS)
+            self.reorder(i)
+
+    # ORDERING - nodes with fewest parents first
+    def ordered(self):
+        text = self.text
+        for count in sorted(self.by_num_parents):
+            for i in self.by_num_parents[count]:
+                yield text[i]
+
+    def first(self):
+        if not self.ids:
+            return None
+        bucket = self.by_num_parents[self.min_num_parents]
+        return self.text[next(iter(bucket))]
+
+    # move id i to the bucket matching its current number of parents
+    def reorder(self, i):
+        new = len(self.connections[i]) - self.num_children[i] - \
+            self.num_siblings[i]
+        old = self.num_parents[i]
+        if old != new:
+            self.remove_from_bucket(i, old)
+            self.add_to_bucket(i, new)
+            self.num_parents[i] = new
+
+    def add_to_bucket(self, i, count):
+        if count not in self.by_num_parents:
+            self.by_num_parents[count] = {}
+        self.by_num_parents[count][i] = None
+        if len(self.by_num_parents) == 1 or count < self.min_num_parents:
+            self.min_num_parents = count
+
+    def remove_from_bucket(self, i, count):
+        bucket = self.by_num_parents[count]
+        del bucket[i]
+        if not bucket:
+            del self.by_num_parents[count]
+            if count == self.min_num_parents and self.by_num_parents:
+                self.min_num_parents = min(self.by_num_parents)
+
+
+# bridges and articulation points of the undirected view of Relations,
+# found in one linear pass and recomputed only after the shape changes
+# each sibling group is walked as a hub joined to its members, which
+# connects them the same as an edge per pair would, at the cost of one
+# (walks node ids, a group's hub is -1 - group)
+class Connectivity:
+    def __init__(self, relations):
+        self.relations = relations
+        self.version = None
+        self.num_components = 0
+        # edges (as frozensets of ids) / ids whose removal disconnects the
+        # graph
+        self.bridges = set()
+        self.cut_nodes = set()
+
+    def adjacent(self, i):
+        relations = self.relations
+        if i < 0:
+            return iter(relations.groups[-1 - i])
+        group = relations.group_of[i]
+        # a group down to one member connects nothing
+        if group != NO_GROUP and len(relations.groups[group]) > 1:
+            return iter(relations.linked_ids(i) + [-1 - group])
+        return iter(relations.linked_ids(i))
+
+    def update(self):
+        if self.version == self.relations.version:
+            return
+        relations = self.relations
+        self.num_components = 0
+        self.bridges = set()
+        self.cut_nodes = set()
+        # iterative tarjan, so deep maps don't hit the recursion limit
+        order = {}
+        low = {}
+        for root in relations.ids.values():
+            if root in order:
+                continue
+            self.num_components += 1
+            order[root] = low[root] = len(order)
+            root_children = 0
+            stack = [(root, None, self.adjacent(root))]
+            while stack:
+                node, parent, to_visit = stack[-1]
+                for n in to_visit:
+                    if n not in order:
+                        order[n] = low[n] = len(order)
+                        stack.append((n, node, self.adjacent(n)))
+                        break
+                    elif n != parent:
+                        low[node] = min(low[node], order[n])
+                else:
+                    stack.pop()
+                    if parent is None:
+                        continue
+                    low[parent] = min(low[parent], low[node])
+                    if low[node] > order[parent]:
+                        self.bridges.add(frozenset((parent, node)))
+                    if parent == root:
+                        root_children += 1
+                    elif low[node] >= order[parent]:
+                        self.cut_nodes.add(parent)
+            if root_children > 1:
+                self.cut_nodes.add(root)
+        self.version = relations.version
+
+    def can_remove_edge(self, n1, n2):
+        self.update()
+        if self.num_components != 1:
+            return False
+        relations = self.relations
+        i, j = relations.ids[n1], relations.ids[n2]
+        if relations.same_group_ids(i, j):
+            # the rest of a bigger group still joins them
+            group = relations.group_of[i]
+            return len(relations.groups[group]) > 2 or \
+                frozenset((i, -1 - group)) not in self.bridges
+        return frozenset((i, j)) not in self.bridges
+
+    def can_remove_node(self, node):
+        self.update()
+        if len(self.relations) <= 1:
+            return False
+        if self.num_components == 1:
+            return self.relations.ids[node] not in self.cut_nodes
+        # only removing a lone node can leave the rest connected
+        return self.num_components == 2 and \
+            not self.relations.neighbors(node)
+
+
+# substring search over node text, without lowercasing every node per query
+# trigrams of the lowercased text -> nodes containing them, so a query only
+# has to check nodes that have all of its trigrams
+class SearchIndex:
+    def __init__(self):
+        # node -> lowercased text
+        self.text = {}
+        # trigram -> dict used as an ordered set of nodes
+        self.trigrams = {}
+
+    @staticmethod
+    def trigrams_of(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, node):
+        text = node.lower()
+        self.text[node] = text
+        for t in self.trigrams_of(text):
+            if t not in self.trigrams:
+                self.trigrams[t] = {}
+            self.trigrams[t][node] = None
+
+    def remove(self, node):
+        for t in self.trigrams_of(self.text.pop(node)):
+            del self.trigrams[t][node]
+            if not self.trigrams[t]:
+                del self.trigrams[t]
+
+    # lower is better: exact match, then prefix, then start of a word,
+    # then anywhere - earlier and in shorter text first
+    @staticmethod
+    def score(text, query):
+        position = text.find(query)
+        if text == query:
+            kind = 0
+        elif position == 0:
+            kind = 1
+        elif not text[position - 1].isalnum():
+            kind = 2
+        else:
+            kind = 3
+        return (kind, position, len(text))
+
+    # all nodes containing query (ignoring case), most relevant first
+    def search(self, query):
+        query = query.lower()
+        if len(query) < 3:
+            candidates = self.text
+        else:
+            postings = [self.trigrams.get(t, {})
+                        for t in self.trigrams_of(query)]
+            postings.sort(key=len)
+            candidates = [n for n in postings[0]
+                          if all(n in p for p in postings[1:])]
+        found = [n for n in candidates if query in self.text[n]]
+        found.sort(key=lambda n: self.score(self.text[n], query))
+        return found
+
+    # options containing query (ignoring case), most relevant first
+    # options that aren't nodes are fine too, they just get lowercased
+    def narrow(self, query, options):
+        query = query.lower()
+        found = []
+        for o in options:
+            text = self.text.get(o)
+            if text is None:
+                text = o.lower()
+            if query in text:
+                found.append((self.score(text, query), o))
+        found.sort(key=lambda f: f[0])
+        return [o for _, o in found]
+
+
+# nodes by time of their latest activity, for /r
+# a heap of (-time, node) entries, so the newest k come off in k log n
+# entries go stale when their node is removed or gets a newer time, and are
+# dropped as they come up (or all at once when they pile up)
+class RecencyIndex:
+    def __init__(self, times=()):
+        # node -> time of latest activity
+        self.time = dict(times)
+        self.heap = [(-t, n) for n, t in self.time.items()]
+        heapq.heapify(self.heap)
+
+    def touch(self, node, time):
+        if self.time.get(node) == time:
+            return
+        self.time[node] = time
+        heapq.heappush(self.heap, (-time, node))
+        self.compact()
+
+    def remove(self, node):
+        self.time.pop(node, None)
+        self.compact()
+
+    # rebuild from the live entries once stale ones outnumber them
+    def compact(self):
+        if len(self.heap) > 2 * len(self.time) + 64:
+            self.__init__(self.time)
+
+    # newest number nodes, newest first
+    def newest(self, number):
+        found = []
+        while self.heap and len(found) < number:
+            time, node = heapq.heappop(self.heap)
+            # stale, or a repeat of an entry already found
+            if self.time.get(node) == -time and node not in found:
+                found.append(node)
+        for node in found:
+            heapq.heappush(self.heap, (-self.time[node], node))
+        return found
+
+
+# visits per node id since the last reset, for the traversal heuristic
+# each count is stamped with the epoch it was made in, and counts from an
+# older epoch read as 0 - so a reset is just starting a new epoch
+class VisitCounter:
+    def __init__(self):
+        self.epoch = 0
+        self.counts = array('l')
+        self.epochs = array('l')
+
+    def __getitem__(self, i):
+        if i < len(self.counts) and self.epochs[i] == self.epoch:
+            return self.counts[i]
+        return 0
+
+    def add(self, i):
+        if i >= len(self.counts):
+            missing = i + 1 - len(self.counts)
+            self.counts.extend(array('l', [0]) * missing)
+            self.epochs.extend(array('l', [-1]) * missing)
+        if self.epochs[i] != self.epoch:
+            self.epochs[i] = self.epoch
+            self.counts[i] = 0
+        self.counts[i] += 1
+
+    def reset(self):
+        self.epoch += 1
+
+    # (id, count) of everything visited since the last reset
+    def items(self):
+        return [(i, count) for i, count in enumerate(self.counts)
+                if self.epochs[i] == self.epoch]
+
+
+# options for offer_choice, read from an iterable only as far as needed
+# (so the first page of a long list shows without building all of it)
+class LazyOptions:
+    def __init__(self, options):
+        self.read = []
+        self.rest = iter(options)
+        self.done = False
+
+    # options read so far, after reading up to the first count
+    def fill(self, count):
+        if not self.done and len(self.read) < count:
+            self.read.extend(islice(self.rest, count - len(self.read)))
+            if len(self.read) < count:
+                self.done = True
+        return self.read
+
+    def all(self):
+        if not self.done:
+            self.read.extend(self.rest)
+            self.done = True
+        return self.read
 
 
 # undirected graph of thoughts/ideas/questions
 class Void:
     SAVE_DIR = './saved_sessions/'
     SNAPSHOT_DIR = './saved_sessions/snapshots/'
+    # for /gf - drawings written to files (any format matplotlib can write)
+    DRAWING_DIR = './saved_sessions/drawings/'
+    DRAWING_FORMAT = 'svg'
+    RENDER_IN_BACKGROUND = True
+    # 'binary' (see session_format) or 'gml', either loads
+    SESSION_FORMAT = 'binary'
+    # gml copies of sessions, for other tools
+    EXPORT_DIR = './saved_sessions/exports/'
+    # saves append to a journal of changes next to the session file, until
+    # it holds more than this many changes / this fraction of the graph size
+    JOURNAL_MAX_CHANGES = 200
+    JOURNAL_MAX_FRACTION = .5
+    # auto save (to _auto_save) in the background while running, not just
+    # on crashes - written once this many changes pile up, or this many
+    # seconds after the oldest unwritten one
+    AUTO_SAVE = True
+    AUTO_SAVE_CHANGES = 20
+    AUTO_SAVE_SECONDS = 30
+    # exists while the void runs, left behind by a crash
+    RUNNING_MARKER = './saved_sessions/_auto_save.running'
+    # commands that can be undone with /u, oldest forgotten first
+    UNDO_LIMIT = 1000
+    # visits /b can go back through, oldest forgotten first
+    HISTORY_LIMIT = 1000
+    # options shown at once by offer_choice
+    PAGE_SIZE = 20
+    # what puts a node at the top of /r: 'created' (adding it), 'edited'
+    # (adding it or editing its text) or 'visited' (any of those, or landing
+    # on it) - only creation times are saved, the rest start over on load
+    RECENT_ACTIVITY = 'created'
+    # extra option at the end of search results
+    SEARCH_ALL_OPTION = '[search all sessions]'
+    # answer children/siblings/parents by scanning the whole graph instead of
+    # using the relations index (slow, kept as a reference for checking)
+    REFERENCE_SCANS = False
 
     def __init__(self):
         self.modified = False
         self.name = ''
-        # nodes are strings
-        self.graph = nx.DiGraph()
-        # for traversal heuristic
-        self.num_visits = Counter()
+        # nodes are strings, with their attributes and relationships
+        self.relations = Relations()
+        # which edges/nodes can be removed without disconnecting the graph
+        self.connectivity = Connectivity(self.relations)
+        # for searching node text
+        self.search_index = SearchIndex()
+        # every change to the graph since it was created or loaded, as
+        # journal ops (see session_journal)
+        self.changes = []
+        # for each command that changed the graph, the ops undoing it (see
+        # apply), a tuple per primitive call in the order they were made
+        self.undo_stack = deque(maxlen=self.UNDO_LIMIT)
+        self.redo_stack = deque(maxlen=self.UNDO_LIMIT)
+        # undo ops of the command running now
+        self.undo_group = []
+        # session file path -> (number of changes it has, changes in its
+        # journal, id of its base) for files written/loaded this session
+        # (each file has its own base, so the id is never kept on the graph)
+        self.written = dict()
+        # for searching node text of every saved session and snapshot
+        self.session_search = SessionSearch(
+            [self.SAVE_DIR, self.SNAPSHOT_DIR], self.read_session_nodes)
+        # writes session files off the prompt's thread, kept across
+        # __init__ (new session / load) so writes in flight still land
+        if not hasattr(self, 'saver'):
+            self.saver = BackgroundSaver(self.AUTO_SAVE_CHANGES,
+                                         self.AUTO_SAVE_SECONDS)
+        # listing of session files in each folder
+        self.catalogs = {d: SessionCatalog(d)
+                         for d in [self.SAVE_DIR, self.SNAPSHOT_DIR]}
+        # (graph version, all pairs path lengths) from last drawing
+        self.path_lengths_cache = None
+        # layouts background renders have sent back, not stored yet
+        self.received_layouts = []
+        # for traversal heuristic, visits by node id (see Relations)
+        self.num_visits = VisitCounter()
         # for displaying structure
         self.indentation = 0
-        # for traversing back
-        self.visit_history = []
+        # for traversing back, node ids (so renames carry over, and deleted
+        # nodes are skipped when they come up)
+        self.visit_history = deque(maxlen=self.HISTORY_LIMIT)
         # for getting recent additions
         self.recently_added = []
+        # nodes by latest activity (see RECENT_ACTIVITY)
+        self.recency = RecencyIndex()
+        # answers to pick/rank questions, saved with the session
+        self.preferences = PreferenceStore()
+        # whether offer_choice's last pick was left to chance (allow_rng)
+        self.chosen_by_chance = False
         # initialize colorama for windows, but not if on eshell
         if os.name == 'nt' and not('EMACS_DIR' in os.environ):
             init()
 
     # BASIC UTILITIES
     def is_empty(self):
-        return not self.graph
+        return not self.relations
 
     def contains(self, node):
-        return node in self.graph
+        return node in self.relations
 
     def degree(self, node):
-        return self.graph.degree(node)
+        return len(self.neighbors(node))
 
     def in_degree(self, node):
-        return self.graph.in_degree(node)
+        return len(self.parents(node)) + len(self.siblings(node))
 
     def out_degree(self, node):
-        return self.graph.out_degree(node)
+        return len(self.children(node)) + len(self.siblings(node))
 
+    # node with fewest parents first (source of the graph)
     def nodes(self):
-        all_nodes = [n for n in self.graph]
-        # put node with fewest parents first (source of the graph)
-        return sorted(all_nodes, key=lambda n: len(self.parents(n)))
+        if self.REFERENCE_SCANS:
+            return self.scan_nodes()
+        return list(self.relations.ordered())
 
     def children(self, node):
-        return [n for n in self.graph
-                if n in self.graph[node] and
-                node not in self.graph[n]]
+        if self.REFERENCE_SCANS:
+            return self.scan_children(node)
+        return self.relations.children_of(node)
 
     def siblings(self, node):
-        return [n for n in self.graph
-                if n in self.graph[node] and
-                node in self.graph[n]]
+        if self.REFERENCE_SCANS:
+            return self.scan_siblings(node)
+        return self.relations.siblings_of(node)
 
     def parents(self, node):
-        return [n for n in self.graph
-                if node in self.graph[n] and
-                n not in self.graph[node]]
+        if self.REFERENCE_SCANS:
+            return self.scan_parents(node)
+        return self.relations.parents_of(node)
 
     def neighbors(self, node):
         return self.children(node) + self.siblings(node) + self.parents(node)
 
+    def are_connected(self, n1, n2):
+        if self.REFERENCE_SCANS:
+            return n2 in self.neighbors(n1)
+        return self.relations.are_connected(n1, n2)
+
+    def are_siblings(self, n1, n2):
+        if self.REFERENCE_SCANS:
+            return n2 in self.siblings(n1)
+        return self.relations.are_siblings(n1, n2)
+
+    # edge n1 -> n2, or n1 and n2 in the same sibling group
+    def has_edge(self, n1, n2):
+        return self.relations.has_edge(n1, n2) or \
+            (n1 != n2 and self.relations.same_group(n1, n2))
+
+    # reference versions of the lookups above, scanning every node of the
+    # map as a networkx graph
+    def scan_nodes(self):
+        graph = self.export_graph()
+        return sorted(graph, key=lambda n: len(self.scan_parents(n, graph)))
+
+    def scan_children(self, node, graph=None):
+        graph = graph or self.export_graph()
+        return [n for n in graph
+                if graph.has_edge(node, n) and not graph.has_edge(n, node)]
+
+    def scan_siblings(self, node, graph=None):
+        graph = graph or self.export_graph()
+        return [n for n in graph
+                if graph.has_edge(node, n) and graph.has_edge(n, node)]
+
+    def scan_parents(self, node, graph=None):
+        graph = graph or self.export_graph()
+        return [n for n in graph
+                if graph.has_edge(n, node) and not graph.has_edge(node, n)]
+
     def is_valid_node_name(self, name):
         return name and name[0] != '/'
 
+    # saved files have no extension, and live directly in their folder
+    def is_valid_file_name(self, name):
+        return name and not any(c in name for c in '/.\\')
+
+    # a new session is named after its first node (a recovered one has no
+    # name but isn't new, it gets one when saved)
+    def name_after(self, node):
+        if not self.name and self.is_empty():
+            self.name = node
+
     def add_parent(self, node, node_from=None):
         self.modified = True
-        if not self.name:
-            self.name = node
+        self.name_after(node)
         if not self.contains(node):
-            self.graph.add_node(node)
-            self.set_time_created(node)
-        if node_from and node_from not in self.neighbors(node):
-            self.graph.add_edge(node, node_from)
+            self.insert_node(node)
+        if node_from and node_from != node and \
+           not self.are_connected(node, node_from):
+            self.add_edge(node, node_from)
         return node
 
     def add_child(self, node, node_from=None):
         self.modified = True
-        if not self.name:
-            self.name = node
+        self.name_after(node)
         if not self.contains(node):
-            self.graph.add_node(node)
-            self.set_time_created(node)
-        if node_from and node_from not in self.neighbors(node):
-            self.graph.add_edge(node_from, node)
+            self.insert_node(node)
+        if node_from and node_from != node and \
+           not self.are_connected(node, node_from):
+            self.add_edge(node_from, node)
         return node
 
     def add_sibling(self, node, node_from=None):
         self.modified = True
-        if not self.name:
-            self.name = node
+        self.name_after(node)
         if not self.contains(node):
-            self.graph.add_node(node)
-            self.set_time_created(node)
-        if node_from and node_from not in self.siblings(node):
-            for s in self.siblings(node_from):
-                self.graph.add_edge(s, node)
-                self.graph.add_edge(node, s)
+            self.insert_node(node)
+        if node_from and node_from != node and \
+           not self.are_siblings(node, node_from):
+            # joining node_from's group makes node a sibling of the whole
+            # group at once, only siblings outside it need edges
+            for s in self.relations.linked_siblings_of(node_from):
+                if s != node:
+                    self.add_edge(s, node)
+                    self.add_edge(node, s)
             for p in self.parents(node_from):
-                self.graph.add_edge(p, node)
-            self.graph.add_edge(node_from, node)
-            self.graph.add_edge(node, node_from)
+                if p != node:
+                    self.add_edge(p, node)
+            self.join_group(node, node_from)
         return node
 
+    # put node in the sibling group of node_from (starting one if needed)
+    def join_group(self, node, node_from):
+        group = self.relations.group(node_from)
+        if group is None:
+            group = self.relations.new_group()
+            self.set_group(node_from, group)
+        if self.relations.group(node) is not None:
+            self.leave_group(node)
+        # no edges within a group
+        for n in self.relations.linked(node):
+            if self.relations.group(n) == group:
+                if self.relations.has_edge(node, n):
+                    self.delete_edge(node, n)
+                if self.relations.has_edge(n, node):
+                    self.delete_edge(n, node)
+        self.set_group(node, group)
+
+    # take node out of its sibling group, keeping it a sibling of the rest
+    # of the group through edges (so one pair in a group can change)
+    def leave_group(self, node):
+        group = self.relations.group(node)
+        others = [n for n in self.relations.members(group) if n != node]
+        self.set_group(node, None)
+        for n in others:
+            self.add_edge(node, n)
+            self.add_edge(n, node)
+
     def add_node(self, node, node_from=None, relationship='sibling'):
         if type(node) != str:
             self.print_red('Can only add strings as nodes!')
@@ -120,7 +996,7 @@ class Void:
         if not self.is_valid_node_name(node):
             self.print_red('Invalid node name')
             return
-        if node in self.nodes():
+        if self.contains(node):
             self.print_red('Node name already in graph')
             if not self.offer_choice(['connect to existing?'], default=0):
                 return
@@ -134,16 +1010,83 @@ class Void:
             assert(relationship == 'sibling')
             return self.add_sibling(node, node_from)
 
+    # add a lone node (no edges) to the graph and the indexes
+    def insert_node(self, node):
+        self.relations.add_node(node)
+        self.set_time_created(node)
+        self.index_new_node(node)
+
+    # put back a node with its old attributes (for undo)
+    def restore_node(self, node, data):
+        self.modified = True
+        self.relations.add_node(node, data)
+        self.index_new_node(node, data.get(SIBLING_GROUP))
+
+    def index_new_node(self, node, group=None):
+        self.search_index.add(node)
+        self.recency.touch(node, self.get_time_created(node))
+        self.changes.append(
+            ('node', node, self.relations.time_created(node)))
+        if group is not None:
+            self.relations.join(node, group)
+            self.changes.append(('group', node, group))
+        self.undo_group.append((('delete', node),))
+
+    # move node to sibling group (None for none)
+    def set_group(self, node, group):
+        self.modified = True
+        old = self.relations.group(node)
+        self.undo_group.append((('group', node, old),))
+        if old is not None:
+            self.relations.leave(node)
+        if group is not None:
+            self.relations.join(node, group)
+        self.changes.append(('group', node, group))
+
+    # ops putting node back as it is now, with its edges
+    def undo_delete_ops(self, node):
+        ops = [('node', node, self.relations.data_of(node))]
+        ops.extend(('edge', node, n) for n in self.relations.successors(node))
+        ops.extend(('edge', n, node)
+                   for n in self.relations.predecessors(node))
+        return ops
+
     def remove_node_and_edges(self, node):
         self.modified = True
-        self.graph.remove_node(node)
+        self.undo_group.append(tuple(self.undo_delete_ops(node)))
+        self.relations.remove_node(node)
+        self.search_index.remove(node)
+        self.recency.remove(node)
+        self.preferences.remove(node)
+        self.changes.append(('delete', node))
 
     def add_edge(self, n1, n2):
         self.modified = True
-        self.graph.add_edge(n1, n2)
+        if self.relations.same_group(n1, n2):
+            # already siblings
+            return
+        if not self.relations.has_edge(n1, n2):
+            self.undo_group.append((('unedge', n1, n2),))
+        self.relations.add_edge(n1, n2)
+        self.changes.append(('edge', n1, n2))
+
+    # remove edge even if it disconnects the graph
+    def delete_edge(self, n1, n2):
+        self.modified = True
+        if self.relations.same_group(n1, n2):
+            self.leave_group(n1)
+        self.undo_group.append((('edge', n1, n2),))
+        self.relations.remove_edge(n1, n2)
+        self.changes.append(('unedge', n1, n2))
 
     def can_remove_edge(self, n1, n2):
-        test_graph = nx.Graph(self.graph.copy())
+        if self.REFERENCE_SCANS:
+            return self.scan_can_remove_edge(n1, n2)
+        return self.connectivity.can_remove_edge(n1, n2)
+
+    # reference version, checking connectivity of a copy of the graph
+    def scan_can_remove_edge(self, n1, n2):
+        test_graph = nx.Graph(self.export_graph())
         test_graph.remove_edge(n1, n2)
         return nx.is_connected(test_graph)
 
@@ -151,51 +1094,150 @@ class Void:
         if not self.can_remove_edge(n1, n2):
             self.print_red('removing edge would disconnect graph, aborting')
             return
-        self.graph.remove_edge(n1, n2)
-        self.modified = True
+        self.delete_edge(n1, n2)
 
     # functions for creation timestamps (to keep the constants in one place)
-    def set_time_created(self, node):
-        assert(node in self.graph)
+    @staticmethod
+    def epoch_time():
         epoch = datetime.datetime.utcfromtimestamp(0)
         timestamp = datetime.datetime.now()
-        epoch_time = (timestamp - epoch).total_seconds()
-        self.graph.nodes[node]['timeCreated'] = epoch_time
+        return (timestamp - epoch).total_seconds()
+
+    def set_time_created(self, node):
+        self.relations.set_time_created(node, Void.epoch_time())
 
     def get_time_created(self, node):
-        if 'time_created' in self.graph.nodes[node]:
-            return self.graph.nodes[node]['timeCreated']
-        else:
-            return datetime.datetime.min
+        time = self.relations.time_created(node)
+        if time is None:
+            # saved before creation times were kept, count as oldest
+            return 0.0
+        return time
 
     # not really a class function but I think clearer to put here
+    # renames node to new in a networkx graph (replaying a journal on load),
+    # touching only node's own edges - node's attributes (creation time,
+    # position, group) go with it, unless new is already in graph, then node
+    # is merged into new and new keeps its own (see Relations.merge)
     @staticmethod
     def edit_networkX_node(graph, node, new):
-        edges = [e for e in graph.edges() if node in e]
+        if new == node:
+            return
+        successors = list(graph.succ[node])
+        predecessors = list(graph.pred[node])
+        merging = new in graph
+        data = graph.nodes[node]
         graph.remove_node(node)
-        graph.add_node(new)
-        for e in edges:
-            if e[0] == node:
-                assert(e[1] != node)
-                graph.add_edge(new, e[1])
-            elif e[1] == node:
-                graph.add_edge(e[0], new)
-            else:
-                assert(False)
+        if not merging:
+            graph.add_node(new, **data)
+        new_group = graph.nodes[new].get(SIBLING_GROUP)
+
+        def keep(other):
+            # renaming onto a neighbor merges the two, don't loop back
+            if other == new:
+                return False
+            # nor link new to its own group
+            return new_group is None or \
+                graph.nodes[other].get(SIBLING_GROUP) != new_group
+        graph.add_edges_from((new, n) for n in successors if keep(n))
+        graph.add_edges_from((n, new) for n in predecessors if keep(n))
 
     def edit_node(self, node, new):
         self.modified = True
-        Void.edit_networkX_node(self.graph, node, new)
+        # merged node's group siblings have to carry over as edges
+        if new != node and self.contains(new) and \
+           self.relations.group(node) is not None:
+            self.leave_group(node)
+        # undone by dropping new, then putting back new (if it was merged
+        # into) and node as they were
+        undo = [('delete', new)]
+        if new != node and self.contains(new):
+            undo += self.undo_delete_ops(new)
+        undo += self.undo_delete_ops(node)
+        # nodes before edges
+        undo.sort(key=lambda op: op[0] == 'edge')
+        self.undo_group.append(tuple(undo))
+        if new != node and new in self.relations:
+            # node's connections carry over to new
+            self.relations.merge(node, new)
+        else:
+            # same id and connections, just new text
+            self.relations.rename(node, new)
+        self.search_index.remove(node)
+        if new not in self.search_index.text:
+            self.search_index.add(new)
+        self.recency.remove(node)
+        self.preferences.rename(node, new)
+        if self.RECENT_ACTIVITY == 'created':
+            self.recency.touch(new, self.get_time_created(new))
+        else:
+            self.recency.touch(new, Void.epoch_time())
+        self.changes.append(('rename', node, new))
+
+    # UNDO - each op is a primitive call: ('node', node, attributes),
+    # ('edge', n1, n2), ('unedge', n1, n2), ('group', node, group) or
+    # ('delete', node)
+    def apply(self, op):
+        kind = op[0]
+        if kind == 'node':
+            self.restore_node(op[1], op[2])
+        elif kind == 'group':
+            self.set_group(op[1], op[2])
+        elif kind == 'edge':
+            self.add_edge(op[1], op[2])
+        elif kind == 'unedge':
+            self.delete_edge(op[1], op[2])
+        elif kind == 'delete':
+            self.remove_node_and_edges(op[1])
+
+    # file the ops undoing the command that just ran
+    def end_command(self):
+        if self.undo_group:
+            self.undo_stack.append(self.undo_group)
+            self.redo_stack.clear()
+            self.undo_group = []
+
+    # undo the last command on from_stack, filing what redoes it on
+    # to_stack - returns a node it touched, to land on
+    def undo_from(self, from_stack, to_stack):
+        if not from_stack:
+            return
+        group = from_stack.pop()
+        self.undo_group = []
+        for undo in reversed(group):
+            for op in undo:
+                self.apply(op)
+        to_stack.append(self.undo_group)
+        self.undo_group = []
+        for undo in reversed(group):
+            for op in undo:
+                if self.contains(op[1]):
+                    return op[1]
+        return self.primary_node()
+
+    def undo(self):
+        if not self.undo_stack:
+            self.print_red('nothing to undo')
+            return
+        node = self.undo_from(self.undo_stack, self.redo_stack)
+        self.print_purple('undone!')
+        return node
+
+    def redo(self):
+        if not self.redo_stack:
+            self.print_red('nothing to redo')
+            return
+        node = self.undo_from(self.redo_stack, self.undo_stack)
+        self.print_purple('redone!')
+        return node
 
+    # newest number nodes by RECENT_ACTIVITY
     def get_recent(self, number):
-        nodes_by_time = sorted(self.nodes(), key=self.get_time_created)
-        nodes_by_time.reverse()
-        num_return = min(number, len(nodes_by_time))
-        return nodes_by_time[0:num_return]
+        return self.recency.newest(number)
 
     def debug_print(self):
-        print(self.graph.nodes.data())
-        print(self.num_visits)
+        print(self.relations.to_graph().nodes.data())
+        print({self.relations.text[i]: count
+               for i, count in self.num_visits.items()})
 
     # DISPLAY + STYLES
     def print_welcome(self):
@@ -258,100 +1300,177 @@ class Void:
         if (not name) and default:
             print(default)
             name = default
-        if not name or '/' in name or '.' in name or '\\' in name:
+        if not self.is_valid_file_name(name):
             self.print_red('invalid file name, aborting\n')
             return None
         return name
 
     # offer choices in a numbered list - returns None if no answer
+    # pick one of options (any iterable, only read as far as the pages shown
+    # need) by number or exact text, a page at a time - typing anything else
+    # narrows the options shown to the ones matching it, returns None if
+    # nothing is picked
     def offer_choice(self, options, **kwargs):
         default = kwargs.get('default', None)
         allow_rng = kwargs.get('allow_rng', False)
-        if not options:
-            self.print_red('no options to choose from')
-            return
-        if default is not None and \
-           not (type(default) == int and default < len(options)):
-            self.print_red('BUG - invalid default given to offer_choice')
-            default = None
-        # special y/n query for single option, always default
-        if len(options) == 1:
-            print('0) ' + options[0], end='')
-            def_s = 'y' if default == 0 else 'n'
-            self.print_purple(' (y/n, default {})\n'.format(def_s), end='')
-            choice = input()
-            if choice == 'y' or choice == '0' or choice == options[0]:
-                return options[0]
-            if choice == '' and default == 0:
-                self.print_purple('defaulting - yes')
-                return options[0]
-            if choice == 'n':
-                return
-            if choice == '' and default != 0:
-                self.print_purple('defaulting - no')
+        page = kwargs.get('page', 0)
+        options = LazyOptions(options)
+        self.chosen_by_chance = False
+        while True:
+            first = options.fill(self.PAGE_SIZE + 1)
+            if not first:
+                self.print_red('no options to choose from')
                 return
-            self.print_red('invalid choice, picking no')
-            return
-        for i, r in enumerate(options):
-            print(str(i) + ') ' + r)
-        # multiple options - numerical list
-        if allow_rng:
-            self.print_purple('(decimal => rng for option 0)')
-        if default is not None:
-            prompt = 'choose # or search (default - {}):'.format(
-                options[default])
-        else:
-            prompt = 'choose # or search:'
-        self.print_bold(prompt)
-        choice = input()
-        if choice.isdigit() and int(choice) < len(options):
-            return options[int(choice)]
-        # choosing via typing the exact contents
-        elif choice in options:
-            return choice
-        elif not choice and default is not None:
-            print(options[default])
-            return options[default]
-        # see if user input probability for first option
-        elif allow_rng and choice:
-            try:
-                probability = float(choice)
-            except ValueError:
-                probability = 0
-            # only interpret decimals between 0 and 1 exclusive as probability
-            if choice[0] == '.' or (probability > 0 and probability < 1):
+            if default is not None and \
+               not (type(default) == int and
+                    default < len(options.fill(default + 1))):
+                self.print_red('BUG - invalid default given to offer_choice')
+                default = None
+            # special y/n query for single option, always default
+            if len(first) == 1:
+                return self.offer_single_choice(first[0], default)
+            choice = self.offer_page(options, page, default, allow_rng)
+            if choice.isdigit() and \
+               int(choice) < len(options.fill(int(choice) + 1)):
+                return options.read[int(choice)]
+            # choosing via typing the exact contents
+            elif choice in options.all():
+                return choice
+            elif not choice and default is not None:
+                print(options.read[default])
+                return options.read[default]
+            # see if user input probability for first option
+            elif allow_rng and choice:
+                try:
+                    probability = float(choice)
+                except ValueError:
+                    probability = 0
+                # only interpret decimals between 0 and 1 exclusive as
+                # probability
+                if not (choice[0] == '.' or 0 < probability < 1):
+                    return
                 if random.random() < probability:
-                    print(options[0])
-                    return options[0]
-                else:
-                    if len(options) == 2:
-                        print(options[1])
-                        return options[1]
-                    return self.offer_choice(options[1:], allow_rng=True)
-        # try narrow options by search
-        else:
-            searched = [o for o in options if choice.lower() in o.lower()]
-            if choice and searched:
+                    print(options.read[0])
+                    self.chosen_by_chance = True
+                    return options.read[0]
+                if len(options.read) == 2:
+                    print(options.read[1])
+                    self.chosen_by_chance = True
+                    return options.read[1]
+                options = LazyOptions(options.read[1:])
+                default = None
+            # try narrow options by search, from the ones left so far
+            else:
+                searched = self.search_index.narrow(choice, options.all())
+                if not (choice and searched):
+                    self.print_red('invalid choice')
+                    return
                 print('*narrowed options by search*')
-                return self.offer_choice(searched, default=0)
+                options = LazyOptions(searched)
+                default = 0
+                allow_rng = False
+            page = 0
+
+    def offer_single_choice(self, option, default):
+        print('0) ' + option, end='')
+        def_s = 'y' if default == 0 else 'n'
+        self.print_purple(' (y/n, default {})\n'.format(def_s), end='')
+        choice = input()
+        if choice == 'y' or choice == '0' or choice == option:
+            return option
+        if choice == '' and default == 0:
+            self.print_purple('defaulting - yes')
+            return option
+        if choice == 'n':
+            return
+        if choice == '' and default != 0:
+            self.print_purple('defaulting - no')
+            return
+        self.print_red('invalid choice, picking no')
+
+    # show numbered options a page at a time (negative pages count from
+    # the end), until something other than > or < is typed, and return it
+    def offer_page(self, options, page, default, allow_rng):
+        size = self.PAGE_SIZE
+        if page < 0:
+            page %= (len(options.all()) - 1) // size + 1
+        while True:
+            start = page * size
+            shown = options.fill(start + size + 1)[start:start + size]
+            more = len(options.read) > start + size
+            for i, r in enumerate(shown):
+                print(str(start + i) + ') ' + r)
+            if more or page > 0:
+                # number of pages isn't known until all options are read
+                pages = '?'
+                if options.done:
+                    pages = (len(options.read) - 1) // size + 1
+                self.print_purple('(page {}/{}, > next page, < previous)'
+                                  .format(page + 1, pages))
+            if allow_rng:
+                self.print_purple('(decimal => rng for option 0)')
+            if default is not None:
+                prompt = 'choose # or search (default - {}):'.format(
+                    options.read[default])
             else:
-                self.print_red('invalid choice')
-                return
+                prompt = 'choose # or search:'
+            self.print_bold(prompt)
+            choice = input()
+            if choice == '>' and (more or page > 0):
+                page = page + 1 if more else 0
+            elif choice == '<' and (more or page > 0):
+                if page == 0:
+                    page = (len(options.all()) - 1) // size
+                else:
+                    page -= 1
+            else:
+                return choice
 
     # NAVIGATION
     # search for a node
     def search(self, node):
         node = node.strip()
-        results = [n for n in self.nodes() if node.lower() in n.lower()]
+        results = self.search_index.search(node)
         if results:
             self.print_bold('Search Results:')
-            choice = self.offer_choice(results, default=0)
+            choice = self.offer_choice(
+                results + [self.SEARCH_ALL_OPTION], default=0)
+            if choice == self.SEARCH_ALL_OPTION:
+                return self.search_all(node)
             if choice:
                 self.reset_all_visits()
                 self.visit(choice)
             return choice
         else:
             self.print_red('search: nothing found')
+            if self.offer_choice(['search all sessions?']):
+                return self.search_all(node)
+
+    # search every saved session and snapshot, load the one with the node
+    # picked and go to it
+    def search_all(self, query):
+        self.saver.wait()
+        hits = self.session_search.search(query, SearchIndex.score)
+        if not hits:
+            self.print_red('search: nothing found in saved sessions')
+            return
+        self.print_bold('Search Results (all sessions):')
+        options = ['{} [{}]'.format(n, path[len(self.SAVE_DIR):])
+                   for path, n in hits]
+        choice = self.offer_choice(options, default=0)
+        if not choice:
+            return
+        path, node = hits[options.index(choice)]
+        self.offer_save()
+        if path.startswith(self.SNAPSHOT_DIR):
+            self.load_file(self.SNAPSHOT_DIR, path[len(self.SNAPSHOT_DIR):])
+        else:
+            self.load_file(self.SAVE_DIR, path[len(self.SAVE_DIR):])
+        if not self.contains(node):
+            return
+        self.reset_all_visits()
+        self.visit(node)
+        return node
 
     def choose_recent(self):
         print('Recently Changed:')
@@ -360,17 +1479,59 @@ class Void:
 
     def visit(self, node):
         assert(self.contains(node))
-        self.num_visits[node] += 1
-        self.visit_history.append(node)
+        i = self.relations.ids[node]
+        self.num_visits.add(i)
+        # staying on a node doesn't add to the history
+        if not self.visit_history or self.visit_history[-1] != i:
+            self.visit_history.append(i)
+        if self.RECENT_ACTIVITY == 'visited':
+            self.recency.touch(node, Void.epoch_time())
+
+    def visits(self, node):
+        return self.num_visits[self.relations.ids[node]]
 
     def reset_all_visits(self):
-        self.num_visits = Counter()
+        self.num_visits.reset()
         self.indentation = 0
 
     def primary_node(self):
-        return self.nodes()[0]
+        if self.REFERENCE_SCANS:
+            return self.scan_nodes()[0]
+        return self.relations.first()
 
+    # RET - unvisited neighbors first (siblings, then children, then
+    # parents), then the least visited (siblings, then parents, then
+    # children), looking at each neighbor once
     def auto_traverse(self, node=None):
+        if self.is_empty():
+            return ''
+        if self.REFERENCE_SCANS:
+            return self.scan_auto_traverse(node)
+        relations = self.relations
+        if node not in relations:
+            return self.primary_node()
+        i = relations.ids[node]
+        visits = self.num_visits
+        # ((visits, rank), id, indentation step) of the best so far
+        best = None
+        # rank of each kind of neighbor when unvisited / visited, in the
+        # order neighbors() lists them (earlier wins ties)
+        for ids, unvisited, visited, step in [
+                (relations.child_ids(i), 1, 2, 1),
+                (relations.sibling_ids(i), 0, 0, 0),
+                (relations.parent_ids(i), 2, 1, -1)]:
+            for j in ids:
+                count = visits[j]
+                key = (count, visited if count else unvisited)
+                if best is None or key < best[0]:
+                    best = (key, j, step)
+        if best is None:
+            return self.primary_node()
+        self.indentation = max(self.indentation + best[2], 0)
+        return relations.text[best[1]]
+
+    # reference version of auto_traverse, sorting every neighbor
+    def scan_auto_traverse(self, node=None):
         if self.is_empty():
             return ''
         if not self.contains(node) or not self.neighbors(node):
@@ -378,17 +1539,17 @@ class Void:
             return p
         options = []
         # for unvisited, prioritize siblings then children then parents
-        unvisited = [n for n in self.neighbors(node) if self.num_visits[n] < 1]
+        unvisited = [n for n in self.neighbors(node) if self.visits(n) < 1]
         options += sorted(
             unvisited,
             key=lambda n:
             (n in self.parents(node), n in self.children(node)))
         # prioritize less visited, siblings then parents then children
-        visited = [n for n in self.neighbors(node) if self.num_visits[n] > 0]
+        visited = [n for n in self.neighbors(node) if self.visits(n) > 0]
         options += sorted(
             visited,
             key=lambda n:
-            (self.num_visits[n], n in self.children(node), n in self.parents(node)))
+            (self.visits(n), n in self.children(node), n in self.parents(node)))
         choice = options[0]
         self.update_indentation(node, choice)
         return choice
@@ -397,95 +1558,310 @@ class Void:
         if self.is_empty() or not self.visit_history or \
            not self.contains(node):
             return ''
+        # entries of deleted nodes are dropped here as they come up, each
+        # entry is only ever popped once
         while self.visit_history:
-            prev = self.visit_history.pop()
-            if prev in self.nodes() and prev != node:
+            # None if it was deleted since
+            prev = self.relations.text[self.visit_history.pop()]
+            if prev is not None and prev != node:
                 self.update_indentation(node, prev)
                 return prev
         return node
 
     def update_indentation(self, old, new):
         # change display indentation based on child/parent traversals
-        if new in self.children(old):
+        if self.relations.is_parent(old, new):
             self.indentation += 1
-        elif new in self.parents(old):
+        elif self.relations.is_parent(new, old):
             self.indentation -= 1
         self.indentation = max(self.indentation, 0)
 
     # VISUALIZATION
+    # shortest path lengths between all pairs of nodes (ignoring direction)
+    # one bfs per node, cached until nodes or connections change
+    # (used by kamada-kawai when laying out small graphs from scratch)
+    def path_lengths(self):
+        version = self.relations.version
+        if self.path_lengths_cache is None or \
+           self.path_lengths_cache[0] != version:
+            undirected = nx.Graph(self.export_graph())
+            lengths = dict(nx.all_pairs_shortest_path_length(undirected))
+            self.path_lengths_cache = (version, lengths)
+        return self.path_lengths_cache[1]
+
+    # nodes within radius steps of node, following any kind of connection
+    def neighborhood(self, node, radius):
+        found = {node: None}
+        frontier = [node]
+        for _ in range(radius):
+            next_frontier = []
+            for n in frontier:
+                for m in self.neighbors(n):
+                    if m not in found:
+                        found[m] = None
+                        next_frontier.append(m)
+            frontier = next_frontier
+        return list(found)
+
+    # networkx graph of the map (or just nodes of it) with each sibling
+    # group spelled out as edges both ways, for anything outside the void
+    def export_graph(self, nodes=None):
+        graph = self.relations.to_graph(nodes)
+        groups = {self.relations.group(n) for n in graph} - {None}
+        for group in groups:
+            members = [n for n in self.relations.members(group)
+                       if n in graph]
+            graph.add_edges_from((a, b) for a in members for b in members
+                                 if a != b)
+        for n in graph:
+            graph.nodes[n].pop(SIBLING_GROUP, None)
+        return graph
+
+    # graph to lay out for a drawing, with stored positions to start from
+    # (only the nodes within radius steps of center, if center given - laid
+    # out on their own, so cost depends on the neighborhood only)
+    def drawing_graph(self, center=None, radius=None):
+        if center is None:
+            return self.export_graph()
+        graph = self.export_graph(self.neighborhood(center, radius))
+        for n in graph:
+            graph.nodes[n].pop('x', None)
+            graph.nodes[n].pop('y', None)
+        return graph
+
+    # keep a layout of the whole map with the session, for placing only new
+    # nodes next time (nodes gone since it was computed are skipped)
+    def store_layout(self, layout):
+        for n, (x, y) in layout.items():
+            if n in self.relations:
+                self.relations.set_position(n, x, y)
+        # positions don't go in the journal, so every file gets a full
+        # write next time to keep them
+        self.written = dict()
+
+    # store layouts background renders have sent back so far
+    def collect_layouts(self):
+        while self.received_layouts:
+            self.store_layout(self.received_layouts.pop(0))
+
+    # graph to draw, labelled and with positions, ready for graph_render
+    def drawing(self, center=None, radius=None):
+        import graph_layout
+        import graph_render
+        graph = self.drawing_graph(center, radius)
+        if center is not None:
+            undirected = nx.Graph(graph)
+            layout = graph_layout.compute(
+                graph,
+                lambda: dict(nx.all_pairs_shortest_path_length(undirected)))
+        else:
+            layout = graph_layout.compute(graph, self.path_lengths)
+            self.store_layout(layout)
+        return graph_render.prettify(graph, layout)
+
     # draw graph in new window
-    def draw(self):
-        if self.graph:
+    def draw(self, center=None, radius=None):
+        if not self.is_empty():
             print('Drawing Graph... \n(Close window to resume)', flush=True)
-
-            # copy prettified version of the map
-            def insert_newlines(string, every):
-                lines = []
-                start = 0
-                while start < len(string):
-                    end = start + every
-                    while end < len(string) and string[end] != ' ':
-                        end -= 1
-                        if end == start:
-                            end = start + every
-                            break
-                    lines.append(string[start:end])
-                    start = end
-                return '\n'.join(lines)
-
-            def format_node_text(string):
-                return insert_newlines(string, 22)
-            pretty_version = self.graph.copy()
-            # color todo
-            color_map = []
-            for n in pretty_version.nodes():
-                color_map.append('#00a400')
-
-            # format text
-            for node in [n for n in pretty_version.nodes()]:
-                text = format_node_text(node)
-                Void.edit_networkX_node(pretty_version, node, text)
-
-            distances = dict()
-            for n in pretty_version.nodes():
-                distances[n] = dict()
-                for n2 in pretty_version.nodes():
-                    if n != n2:
-                        undirected = nx.Graph(pretty_version)
-                        d = nx.shortest_path_length(undirected, n, n2)
-                        distances[n][n2] = 2 + d
-            pos = nx.kamada_kawai_layout(pretty_version, dist = distances)
-            nx.draw(
-                pretty_version,
-                pos,
-                with_labels=True,
-                font_weight='bold',
-                node_color=color_map,
-                edge_color='gray'
-            )
-            mng = matplotlib.pyplot.get_current_fig_manager()
-            # mng.window.state('zoomed')
-            # hack to cause window focus, not sure why it works
-            mng.window.state('iconic')
-            mng.window.minsize(width=1080, height=640)
-            matplotlib.pyplot.margins(x=.12)
-            matplotlib.pyplot.show()
+            import graph_render
+            try:
+                graph_render.show(*self.drawing(center, radius))
+            except ImportError:
+                self.print_red('no window to draw in, use /gf instead')
         else:
             self.print_red('nothing to draw yet')
 
+    # draw graph to an image file in DRAWING_DIR (no window needed)
+    # by default in a separate process, so the prompt isn't held up
+    def render(self, center=None, radius=None, background=None):
+        import graph_render
+        if self.is_empty():
+            self.print_red('nothing to draw yet')
+            return
+        if background is None:
+            background = self.RENDER_IN_BACKGROUND
+        name = self.name or 'untitled'
+        if center is not None:
+            name += ' - ' + center
+        name = ''.join(c if c.isalnum() or c in ' _-' else '_' for c in name)
+        path = self.DRAWING_DIR + name + '.' + self.DRAWING_FORMAT
+        os.makedirs(self.DRAWING_DIR, exist_ok=True)
+        if background:
+            # clean up after finished renders
+            multiprocessing.active_children()
+            # layout happens there too, the positions of a whole map come
+            # back to be stored (see collect_layouts)
+            sender = None
+            if center is None:
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                # read as soon as it's sent, a full pipe would hold up the
+                # render (a new session's list never sees old layouts)
+                layouts = self.received_layouts
+
+                def receive():
+                    try:
+                        layouts.append(receiver.recv())
+                    except (EOFError, OSError):
+                        # render died before laying out
+                        pass
+                    receiver.close()
+                threading.Thread(target=receive, daemon=True).start()
+            multiprocessing.Process(
+                target=graph_render.layout_and_render,
+                args=(self.drawing_graph(center, radius), path,
+                      sender)).start()
+            if sender is not None:
+                sender.close()
+            print('drawing to ' + path + ' in background')
+        else:
+            graph_render.render_file(*self.drawing(center, radius), path)
+            print('drawn to ' + path)
+        return path
+
     # SESSION SAVING - saved files have no extension
+    # oldest first
     def saved_sessions(self, directory):
-        sessions = []
-        files = []
-        files = os.listdir(directory)
-
-        def get_path(name):
-            return os.path.join(directory + name)
-        files.sort(key=lambda f: os.path.getmtime(get_path(f)))
-        for f in files:
-            if os.path.isfile(get_path(f)) and '.' not in f:
-                sessions.append(f)
-        return sessions
+        self.saver.wait()
+        return self.catalogs[directory].names()
+
+    # (catalog of folder holding session file at path, file name)
+    def catalog_entry(self, path):
+        directory, name = os.path.split(path)
+        return self.catalogs[directory + '/'], name
+
+    # write session to file - if the file was written/loaded this session,
+    # only append the changes since then to its journal, otherwise (or once
+    # the journal gets long) write the whole graph as a new base
+    # decided here, written by the saver from copies (urgent: start now)
+    def write_session(self, path, urgent=True):
+        done, in_journal, base_id = self.written.get(path, (0, 0, None))
+        new = self.changes[done:]
+        if path in self.written:
+            limit = max(self.JOURNAL_MAX_CHANGES,
+                        self.JOURNAL_MAX_FRACTION * len(self.relations))
+            if in_journal + len(new) <= limit:
+                self.written[path] = (len(self.changes),
+                                      in_journal + len(new), base_id)
+                if new:
+                    nodes = len(self.relations)
+
+                    def append():
+                        # a journal without its base would never be read
+                        if not os.path.exists(path):
+                            raise FileNotFoundError(path + ' is gone')
+                        session_journal.append(path, base_id, new)
+                        self.session_search.append(path, new)
+                        catalog, name = self.catalog_entry(path)
+                        catalog.update(name, nodes)
+                    self.saver.submit(append, len(new), urgent)
+                return
+        base_id = session_journal.new_base_id()
+        self.written[path] = (len(self.changes), 0, base_id)
+        self.store_preferences()
+        relations = self.relations.copy()
+        binary = self.SESSION_FORMAT == 'binary'
+
+        def write():
+            graph = relations.to_graph()
+            graph.graph[session_journal.BASE_ID] = base_id
+            # write then swap in, a crash mid-write keeps old base + journal
+            if binary:
+                session_format.write(graph, path + '.tmp')
+            else:
+                nx.write_gml(graph, path + '.tmp')
+            os.replace(path + '.tmp', path)
+            session_journal.remove(path)
+            self.session_search.update(path, graph)
+            catalog, name = self.catalog_entry(path)
+            catalog.update(name, len(graph))
+        self.saver.submit(write, len(new), urgent)
+
+    # show failed background writes, the next save of every file then
+    # starts over with a full write
+    def check_saves(self):
+        while self.saver.errors:
+            self.print_red('saving failed:\n' + self.saver.errors.pop(0))
+            self.written = dict()
+
+    # graph saved in file at path, with its journal applied
+    # returns (graph, number of changes in journal, id of the file's base -
+    # taken off the graph, None for files saved before journals)
+    @staticmethod
+    def read_session(path):
+        graph = session_format.read_any(path)
+        base_id = graph.graph.pop(session_journal.BASE_ID, None)
+        changes = session_journal.read(path, base_id)
+        preferences = PreferenceStore.from_graph(graph)
+        session_journal.replay(graph, changes, Void.edit_networkX_node,
+                               preferences)
+        if preferences or PREFERENCES in graph.graph:
+            graph.graph[PREFERENCES] = preferences.to_attribute()
+        return graph, len(changes), base_id
+
+    # put the answers to picks in the graph attributes, for a full write
+    def store_preferences(self):
+        attributes = self.relations.attributes
+        if self.preferences or PREFERENCES in attributes:
+            attributes[PREFERENCES] = self.preferences.to_attribute()
+
+    # turn siblings linked by edges into sibling groups, where they form a
+    # clique (as add_sibling made them before groups existed)
+    # returns number of groups made
+    @staticmethod
+    def group_siblings(graph):
+        def mutual(n):
+            return [m for m in graph.succ[n]
+                    if m != n and graph.has_edge(m, n) and
+                    SIBLING_GROUP not in graph.nodes[m]]
+        groups = [g for _, g in graph.nodes(data=SIBLING_GROUP)
+                  if g is not None]
+        next_group = max(groups) + 1 if groups else 0
+        seen = set()
+        made = 0
+        for start in graph:
+            if start in seen or SIBLING_GROUP in graph.nodes[start]:
+                continue
+            seen.add(start)
+            # sibling component around start
+            component = [start]
+            for n in component:
+                for m in mutual(n):
+                    if m not in seen:
+                        seen.add(m)
+                        component.append(m)
+            if len(component) < 2 or \
+               any(len(mutual(n)) != len(component) - 1 for n in component):
+                continue
+            for n in component:
+                for m in component:
+                    if m != n:
+                        graph.remove_edge(n, m)
+                graph.nodes[n][SIBLING_GROUP] = next_group
+            next_group += 1
+            made += 1
+        return made
+
+    def read_session_nodes(self, path):
+        return list(Void.read_session(path)[0])
+
+    def export_gml(self):
+        new_name = self.rename()
+        if not new_name:
+            return
+        os.makedirs(self.EXPORT_DIR, exist_ok=True)
+        path = self.EXPORT_DIR + self.name + '.gml'
+        graph = self.export_graph()
+        self.saver.submit(lambda: nx.write_gml(graph, path), urgent=True)
+        print('exporting to ' + path)
+
+    def delete_session_file(self, path):
+        self.saver.wait()
+        os.remove(path)
+        session_journal.remove(path)
+        self.written.pop(path, None)
+        self.session_search.remove(path)
+        catalog, name = self.catalog_entry(path)
+        catalog.remove(name)
 
     # change name of session and return it, return None if aborted
     def rename(self):
@@ -508,14 +1884,44 @@ class Void:
                     new_name = self.rename()
         if not new_name:
             return
-        nx.write_gml(self.graph, self.SAVE_DIR + self.name)
+        self.write_session(self.SAVE_DIR + self.name)
         self.modified = False
         print('saved!')
 
-    def auto_save(self):
-        if self.modified:
-            nx.write_gml(self.graph, self.SAVE_DIR + '_auto_save')
-            self.print_red('auto-saved!')
+    def auto_save(self, quiet=False):
+        path = self.SAVE_DIR + '_auto_save'
+        if self.modified and \
+           self.written.get(path, (None,))[0] != len(self.changes):
+            # quiet ones are left for the saver to write when it sees fit
+            self.write_session(path, urgent=not quiet)
+            if not quiet:
+                self.print_red('auto-saved!')
+
+    # offer to pick up from the auto save if the last run crashed
+    def recover(self):
+        path = self.SAVE_DIR + '_auto_save'
+        crashed = os.path.exists(self.RUNNING_MARKER)
+        try:
+            os.makedirs(os.path.dirname(self.RUNNING_MARKER), exist_ok=True)
+            open(self.RUNNING_MARKER, 'w').close()
+        except OSError as e:
+            self.print_red("can't mark session as running: {}".format(e))
+        if not crashed or not os.path.exists(path):
+            return
+        self.print_red('the void did not exit cleanly last time')
+        if self.offer_choice(['recover auto-saved session?'], default=0):
+            self.load_file(self.SAVE_DIR, '_auto_save')
+            # no name, so saving asks for a proper one
+            self.name = ''
+            self.modified = True
+            return True
+
+    # wait for writes and mark a clean exit
+    def shut_down(self):
+        self.saver.wait()
+        self.check_saves()
+        if os.path.exists(self.RUNNING_MARKER):
+            os.remove(self.RUNNING_MARKER)
 
     # write to file with timestamp into snapshots folder
     def snapshot(self):
@@ -525,15 +1931,29 @@ class Void:
         timestamp = datetime.datetime.now()
         time_str = timestamp.strftime('%m_%d_%y_%H%M%S')
         snapshot_name = self.name + '_' + time_str
-        nx.write_gml(self.graph, self.SNAPSHOT_DIR + snapshot_name)
+        self.write_snapshot(self.SNAPSHOT_DIR + snapshot_name)
         print('snapshot taken!')
 
+    # snapshots only store the chunks of the map that no earlier snapshot
+    # has (see snapshot_store), they never get a journal
+    def write_snapshot(self, path):
+        self.store_preferences()
+        relations = self.relations.copy()
+
+        def write():
+            graph = relations.to_graph()
+            snapshot_store.write(graph, path)
+            self.session_search.update(path, graph)
+            catalog, name = self.catalog_entry(path)
+            catalog.update(name, len(graph))
+        self.saver.submit(write, urgent=True)
+
     def offer_snapshot(self):
-        if self.nodes() and self.offer_choice(['take snapshot?']):
+        if not self.is_empty() and self.offer_choice(['take snapshot?']):
             self.snapshot()
 
     def offer_save(self):
-        if self.nodes() and self.modified and \
+        if not self.is_empty() and self.modified and \
            self.offer_choice(['session modified, save?']):
             self.save()
 
@@ -543,7 +1963,7 @@ class Void:
             return
         if self.offer_choice(['delete this save?'], default=0):
             self.offer_snapshot()
-            os.remove(self.SAVE_DIR + self.name)
+            self.delete_session_file(self.SAVE_DIR + self.name)
             print('Deleted!')
             self.modified = False
             self.new_session()
@@ -553,7 +1973,8 @@ class Void:
             self.print_red('snapshot aborted')
             return
         if self.offer_choice(['delete this snapshot?'], default=0):
-            os.remove(self.SNAPSHOT_DIR + self.name)
+            self.delete_session_file(self.SNAPSHOT_DIR + self.name)
+            snapshot_store.collect_garbage(self.SNAPSHOT_DIR)
             self.modified = False
             print('deleted!')
 
@@ -561,14 +1982,32 @@ class Void:
         self.offer_save()
         directory = self.SNAPSHOT_DIR if snapshot else self.SAVE_DIR
         self.print_bold('Load Session:')
-        name = self.offer_choice(self.saved_sessions(directory))
+        # start on the last page, with the newest
+        name = self.offer_choice(self.saved_sessions(directory), page=-1)
         if name:
-            self.__init__()
-            self.graph = nx.read_gml(directory + name)
-            self.graph = nx.to_directed(self.graph)
-            self.name = name
-            print('loaded!')
-            return name
+            return self.load_file(directory, name)
+
+    # replace current session with the one saved in directory + name
+    def load_file(self, directory, name):
+        self.saver.wait()
+        self.__init__()
+        graph, in_journal, base_id = Void.read_session(directory + name)
+        # files saved before journals (or sibling groups) existed get a
+        # full write first
+        grouped = Void.group_siblings(graph)
+        if base_id is not None and not grouped:
+            self.written[directory + name] = (0, in_journal, base_id)
+        # the networkx graph is only read from, then dropped
+        self.relations = Relations.from_graph(graph)
+        self.connectivity = Connectivity(self.relations)
+        for n in graph:
+            self.search_index.add(n)
+        self.recency = RecencyIndex(
+            (n, self.get_time_created(n)) for n in graph)
+        self.preferences = PreferenceStore.from_graph(graph)
+        self.name = name
+        print('loaded!')
+        return name
 
     def new_session(self):
         self.offer_save()
@@ -586,14 +2025,18 @@ class Void:
 
     # allow repicking the connections of a node, return all new connections
     def user_add_connection(self, node):
-        assert(node in self.nodes())
+        assert(self.contains(node))
         query = input('Search New Connection: ')
         if query != '' and (not self.is_valid_node_name(query)):
             self.print_red('invalid query, aborting add connection')
             return
-        options = [n for n in self.nodes() if n != node]
-        options = [n for n in options if query.lower() in n.lower()]
-        options = [n for n in options if n not in self.neighbors(node)]
+        if query:
+            options = self.search_index.search(query)
+        else:
+            options = self.nodes()
+        # filtered as the pages are shown
+        options = (n for n in options if n != node and
+                   not self.relations.are_connected(node, n))
         new_connection = self.offer_choice(options, default=0)
         if not new_connection:
             self.print_red('no new connection made')
@@ -613,7 +2056,7 @@ class Void:
         self.print_red('invalid choice, no new connection made')
 
     def user_remove_connection(self, node, exclude=[]):
-        assert(node in self.nodes())
+        assert(self.contains(node))
         # find which nodes we can disconnect without breaking the graph
         # (by removing and checking if path remains, then put it back)
         removable = [n for n in self.neighbors(node)
@@ -647,9 +2090,15 @@ class Void:
         print('Done Moving!')
 
     def can_delete(self, node):
-        if len(self.nodes()) <= 1:
+        if self.REFERENCE_SCANS:
+            return self.scan_can_delete(node)
+        return self.connectivity.can_remove_node(node)
+
+    # reference version, checking connectivity of a copy of the graph
+    def scan_can_delete(self, node):
+        if len(self.relations) <= 1:
             return False
-        test_graph = nx.Graph(self.graph.copy())
+        test_graph = nx.Graph(self.export_graph())
         test_graph.remove_node(node)
         return nx.is_connected(test_graph)
 
@@ -659,9 +2108,8 @@ class Void:
             self.print_red('deleting would disconnect graph')
             return
         neighbors = self.neighbors(node)
-        self.graph.remove_node(node)
+        self.remove_node_and_edges(node)
         print('deleted!')
-        self.modified = True
         return list(neighbors)[0] if neighbors else None
 
     def user_pick(self):
@@ -676,8 +2124,9 @@ class Void:
     def user_pick_sibling(self, node):
         return self.user_pick_tournament(self.siblings(node) + [node])
 
-    # asks user to choose between random pairs until all but one are eliminated
-    def user_pick_tournament(self, nodes):        
+    # asks user to choose between random pairs until all but one are
+    # eliminated (pairs settled by earlier answers aren't asked again)
+    def user_pick_tournament(self, nodes):
         print('let\'s pick something! (tournament style)')
         remaining = set(nodes)
         least_played = set(remaining)
@@ -685,13 +2134,10 @@ class Void:
             if len(least_played) <= 1:
                 least_played = set(remaining)
             a, b = least_played.pop(), least_played.pop()
-            choice = None
-            while not choice:
-                print('')
-                choice = self.offer_choice([a, b], allow_rng=True)
-                if not choice and self.offer_choice(['quit pick?'], default=0):
-                    self.print_red('Aborted')
-                    return
+            choice = self.compare(a, b)
+            if not choice:
+                self.print_red('Aborted')
+                return
             remaining.remove(a)
             remaining.remove(b)
             remaining.add(choice)
@@ -699,13 +2145,86 @@ class Void:
         print('Chosen: ' + str(chosen))
         return chosen
 
+    def user_rank(self):
+        return self.user_rank_nodes(self.nodes())
+
+    def user_rank_children(self, node):
+        if not self.children(node):
+            self.print_red('No Children to Rank, Aborting')
+            return
+        return self.user_rank_nodes(self.children(node))
+
+    def user_rank_siblings(self, node):
+        return self.user_rank_nodes(self.siblings(node) + [node])
+
+    # put nodes in order, best first, returns the best
+    def user_rank_nodes(self, nodes):
+        print('let\'s rank these! (best first)')
+        ranked = self.rank(list(nodes))
+        if ranked is None:
+            self.print_red('Aborted')
+            return
+        self.print_bold('Ranking:')
+        for i, n in enumerate(ranked):
+            print(str(i) + ') ' + n)
+        return ranked[0]
+
+    # nodes best first by merge sort, about n log n comparisons (fewer
+    # when earlier answers settle them), None if the user quits
+    def rank(self, nodes):
+        if len(nodes) <= 1:
+            return nodes
+        middle = len(nodes) // 2
+        left = self.rank(nodes[:middle])
+        right = self.rank(nodes[middle:]) if left is not None else None
+        if right is None:
+            return
+        merged = []
+        i = j = 0
+        while i < len(left) and j < len(right):
+            better = self.compare(left[i], right[j])
+            if not better:
+                return
+            if better == left[i]:
+                merged.append(left[i])
+                i += 1
+            else:
+                merged.append(right[j])
+                j += 1
+        return merged + left[i:] + right[j:]
+
+    # the one of a and b the user prefers, from earlier answers if they
+    # settle it, otherwise asked (and remembered unless left to chance)
+    # None if the user quits
+    def compare(self, a, b):
+        known = self.preferences.preferred(a, b)
+        if known is not None:
+            return known
+        choice = None
+        while not choice:
+            print('')
+            choice = self.offer_choice([a, b], allow_rng=True)
+            if not choice and self.offer_choice(['quit pick?'], default=0):
+                return
+        if not self.chosen_by_chance:
+            self.prefer(choice, b if choice == a else a)
+        return choice
+
+    def prefer(self, winner, loser):
+        self.modified = True
+        self.preferences.record(winner, loser)
+        self.changes.append(('prefer', winner, loser))
+
     def __str__(self):
         return self.recap()
 
     def loop(self):
         self.print_welcome()
         old = ''
+        if self.AUTO_SAVE and self.recover():
+            old = self.auto_traverse()
         while True:
+            self.collect_layouts()
             # spit message and take input
             self.print_bold('(? for options): ', end='')
             # print indentation
@@ -721,15 +2240,18 @@ NAVIGATION:
     ?   - help (online docs one day?)
     _   - create new node as sibling
     >_  - create new node as child
-    //_ - search for node
+    //_ - search for node (then optionally in all saved sessions)
     RET - auto traverse
     /b  - traverse back
     /g  - draw graph
+    /g k - draw nodes within k steps of current node
+    /gf - draw graph to a file (/gf k for nodes within k steps)
     /r  - recent nodes
     /n  - show neighbors
     /p  - pick any a node (tournament-style)
     /pc - pick a child (tournament-style)
     /ps - pick a sibling (tournament-style)
+    /o  - rank all nodes, best first (/oc children, /os siblings)
 
 BASIC OPERATIONS:
     /e  - edit node
@@ -737,6 +2259,8 @@ BASIC OPERATIONS:
     /+  - add connection
     /-  - remove connection
     /m  - move node (add, then remove connection)
+    /u  - undo last change
+    /redo - redo last undone change
 
 SESSIONS + SNAPSHOTS:
     /s  - save session
@@ -746,6 +2270,7 @@ SESSIONS + SNAPSHOTS:
     /ls - load snapshot
     /xs - delete snapshot
     /ln - new session
+    /sg - export session as gml (saves are binary, gml saves load too)
     /q  - quit
                 ''')
             # special commands start with /
@@ -764,6 +2289,12 @@ SESSIONS + SNAPSHOTS:
                         old = result
                 elif new == '/g':
                     self.draw()
+                elif new[:3] == '/g ' and new[3:].strip().isdigit() and old:
+                    self.draw(old, int(new[3:]))
+                elif new == '/gf':
+                    self.render()
+                elif new[:4] == '/gf ' and new[4:].strip().isdigit() and old:
+                    self.render(old, int(new[4:]))
                 elif new == '/e':
                     result = self.user_edit(old)
                     if result:
@@ -781,6 +2312,14 @@ SESSIONS + SNAPSHOTS:
                     result = self.user_move(old)
                     if result:
                         old = result
+                elif new == '/u':
+                    result = self.undo()
+                    if result:
+                        old = result
+                elif new == '/redo':
+                    result = self.redo()
+                    if result:
+                        old = result
                 # SESSION COMMANDS
                 elif new == '/s':
                     self.save()
@@ -797,11 +2336,14 @@ SESSIONS + SNAPSHOTS:
                         old = self.auto_traverse()
                 elif new == '/xs':
                     self.delete_snapshot()
+                elif new == '/sg':
+                    self.export_gml()
                 elif new == '/ln':
                     self.new_session()
                     old = ''
                 elif new == '/q':
                     self.offer_save()
+                    self.shut_down()
                     return
                 elif new == '/p':
                     chosen = self.user_pick()
@@ -815,6 +2357,18 @@ SESSIONS + SNAPSHOTS:
                     chosen = self.user_pick_sibling(old)
                     if chosen:
                         old = chosen
+                elif new == '/o':
+                    chosen = self.user_rank()
+                    if chosen:
+                        old = chosen
+                elif new == '/oc':
+                    chosen = self.user_rank_children(old)
+                    if chosen:
+                        old = chosen
+                elif new == '/os':
+                    chosen = self.user_rank_siblings(old)
+                    if chosen:
+                        old = chosen
                 elif new == '/debug':
                     self.debug_print()
                 else:
@@ -848,6 +2402,10 @@ SESSIONS + SNAPSHOTS:
                     old = new
             else:
                 self.print_red('invalid node name, try again\n')
+            self.end_command()
+            if self.AUTO_SAVE:
+                self.auto_save(quiet=True)
+            self.check_saves()
 
 
 if __name__ == '__main__':
@@ -858,3 +2416,6 @@ if __name__ == '__main__':
     except Exception:
         void.auto_save()
         print(traceback.format_exc())
+    finally:
+        # crashed or not, nothing handed to the saver gets lost
+        void.saver.wait()